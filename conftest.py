@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    """Миниатюры в тестах создаются сразу, без фоновых потоков: поток
+    писал бы в общую тестовую базу SQLite в памяти одновременно с
+    запросом, а её таблицы блокируются без ожидания."""
+    settings.THUMBNAIL_BACKGROUND_WORKERS = 0
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Follow
+from .search import matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        if not search_term:
+            return queryset, False
+        return matching(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 
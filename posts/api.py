@@ -0,0 +1,198 @@
+"""JSON-версия лент для мобильных клиентов.
+
+Те же querysets, что у страниц `index`, `group_posts`, `profile` и
+`follow_index`, но без шаблонов. Страницы листаются курсором
+(`?after=` / `?before=`). `?fields=id,text` ограничивает и поля ответа,
+и столбцы в SELECT. Миниатюры берутся готовыми из `attach_thumbnails`.
+
+ETag общих лент строится из версий кэша, как у страниц для анонимов,
+поэтому запрос с совпавшим `If-None-Match` получает 304 ещё до чтения
+постов. У ленты подписок своей версии нет, и её ETag — хэш ответа: он
+не экономит работу сервера, но экономит трафик. Так же, по телу, считается
+ETag ответа, прочитанного с реплики (реплика может отставать от версий),
+и любого ответа при кэше в памяти процесса (версии в нём свои у каждого
+процесса и могут не знать о чужой записи).
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from yatube.db_router import read_from_replica, used_replica
+
+from . import cache
+from .feed import feed_for
+from .models import Group, Post
+from .paginators import CURSOR_AFTER, CURSOR_BEFORE, CursorPaginator
+from .thumbnails import attach_thumbnails
+from .views import (POSTS_PER_PAGE, group_scopes, index_scopes,
+                    profile_scopes)
+
+User = get_user_model()
+FIELDS_PARAM = 'fields'
+
+
+def image(post):
+    if not post.image:
+        return None
+    thumbnail = getattr(post, 'thumbnail', None)
+    return {
+        'url': post.image.url,
+        'thumbnail': thumbnail.url if thumbnail else None,
+        'srcset': dict(getattr(post, 'srcsets', [])),
+        'placeholder': post.image_placeholder or None,
+    }
+
+
+# Поле ответа: (столбцы для only(), связи для select_related, значение).
+FIELDS = {
+    'id': ((), (), lambda post: post.pk),
+    'text': (('text',), (), lambda post: post.text),
+    'pub_date': ((), (), lambda post: post.pub_date),
+    'author': (('author__username',), ('author',),
+               lambda post: post.author.username),
+    'group': (('group__slug',), ('group',),
+              lambda post: post.group.slug if post.group_id else None),
+    'comment_count': (('comment_count',), (),
+                      lambda post: post.comment_count),
+    'image': (('image', 'image_placeholder'), (), image),
+}
+
+
+def requested_fields(request):
+    """Поля из `?fields=`; без параметра — все. Неизвестное поле —
+    ValueError."""
+    value = request.GET.get(FIELDS_PARAM)
+    if not value:
+        return list(FIELDS)
+    fields = list(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(
+            f'Неизвестные поля: {", ".join(unknown)}; '
+            f'доступны: {", ".join(FIELDS)}')
+    return fields
+
+
+def select(queryset, fields):
+    """Оставь в SELECT только столбцы полей `fields` и ключей курсора."""
+    columns, related = {'pub_date'}, set()
+    for name in fields:
+        field_columns, field_related, _ = FIELDS[name]
+        columns.update(field_columns)
+        related.update(field_related)
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def link(request, param, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop(CURSOR_AFTER, None)
+    query.pop(CURSOR_BEFORE, None)
+    query[param] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def feed_response(request, queryset, keys=('pub_date', 'pk')):
+    try:
+        fields = requested_fields(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    paginator = CursorPaginator(
+        select(queryset, fields), POSTS_PER_PAGE, keys)
+    page = paginator.get_page(after=request.GET.get(CURSOR_AFTER),
+                              before=request.GET.get(CURSOR_BEFORE))
+    if 'image' in fields:
+        attach_thumbnails(page)
+    return JsonResponse({
+        'results': [{name: FIELDS[name][2](post) for name in fields}
+                    for post in page],
+        'next': link(request, CURSOR_AFTER, page.next_cursor),
+        'previous': link(request, CURSOR_BEFORE, page.previous_cursor),
+    }, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def not_modified(request, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def conditional(get_scopes):
+    """Ставь ETag и отвечай 304 на совпавший `If-None-Match`.
+
+    `get_scopes(**kwargs)` возвращает ленты, из которых собран ответ;
+    если их нет (None) или кэш не общий для процессов, ETag считается по
+    телу готового ответа.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            scopes = get_scopes(**kwargs)
+            etag = None
+            if scopes is not None and cache.shared_cache():
+                etag = quote_etag(hashlib.md5(
+                    f'{request.get_full_path()}:'
+                    f'{cache.versions(cache.ALL, *scopes)}'.encode()
+                ).hexdigest())
+                response = not_modified(request, etag)
+                if response is not None:
+                    return response
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if scopes is None:
+                patch_cache_control(response, private=True, max_age=0)
+            else:
+                patch_cache_control(response, public=True, max_age=0)
+            # Ответ с реплики мог не увидеть записи, которые уже подняли
+            # версии, и не должен получить ETag по этим версиям. Версиям
+            # в кэше отдельного процесса тоже верить нельзя.
+            if etag is None or used_replica():
+                etag = quote_etag(hashlib.md5(response.content).hexdigest())
+                unchanged = not_modified(request, etag)
+                if unchanged is not None:
+                    return unchanged
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+
+@read_from_replica
+@conditional(index_scopes)
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@read_from_replica
+@conditional(group_scopes)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, group.posts.all())
+
+
+@read_from_replica
+@conditional(profile_scopes)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.all())
+
+
+@read_from_replica
+@conditional(lambda **kwargs: None)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    post_list, keys = feed_for(request.user)
+    return feed_response(request, post_list, keys)
@@ -0,0 +1,249 @@
+"""Версионированные ключи для кэша лент и страниц.
+
+Каждая лента («index», «group:<id>», «author:<id>», «post:<id>») имеет
+свою версию в кэше, плюс есть общая версия «all». Запись поста или
+комментария поднимает версии затронутых лент, поэтому фрагменты можно
+хранить часами: устаревший фрагмент просто перестаёт совпадать с ключом.
+
+Версия — это время последнего изменения в миллисекундах, поэтому она же
+служит `Last-Modified` для кэша страниц анонимных посетителей.
+"""
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from yatube.db_router import used_replica
+
+from .paginators import page_identity
+
+VERSION_KEY = 'feed:version:{}'
+PAGE_KEY = 'page:{}'
+LOCK_KEY = '{}:lock'
+ALL = 'all'
+# Срок фрагментов в кэше, который у каждого процесса свой.
+LOCAL_FEED_CACHE_TIMEOUT = 20
+# Во сколько раз прошлая копия фрагмента живёт дольше самого фрагмента.
+STALE_TIMEOUT_FACTOR = 4
+
+
+def shared_cache():
+    """Общий ли кэш для всех процессов.
+
+    В `LocMemCache` у каждого процесса свои версии, и запись в одном
+    процессе не поднимает версии остальных.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def feed_cache_timeout():
+    """Срок фрагментов и страниц лент.
+
+    Долгий срок держится только на общем для процессов кэше, иначе срок
+    не больше `LOCAL_FEED_CACHE_TIMEOUT`.
+    """
+    timeout = getattr(settings, 'FEED_CACHE_TIMEOUT', 60 * 60 * 6)
+    if not shared_cache():
+        return min(timeout, LOCAL_FEED_CACHE_TIMEOUT)
+    return timeout
+
+
+def replica_timeout(timeout):
+    """Срок значения, собранного текущим запросом.
+
+    Прочитанное с реплики может отставать от версий лент, поэтому живёт
+    не дольше интервала синхронизации реплик.
+    """
+    if used_replica():
+        return min(timeout, getattr(settings, 'REPLICA_SYNC_INTERVAL', 5))
+    return timeout
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def post_scopes(post):
+    """Ленты и страницы, в которых показывается карточка поста."""
+    scopes = ['index', author_scope(post.author_id), post_scope(post.pk)]
+    if post.group_id is not None:
+        scopes.append(group_scope(post.group_id))
+    return scopes
+
+
+def new_version():
+    # Версия, пропавшая из кэша, не должна начаться заново с
+    # числа, под которым уже могли лежать старые фрагменты.
+    return int(time.time() * 1000)
+
+
+def versions(*scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """Сделай недействительными фрагменты перечисленных лент."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    now = new_version()
+    cache.set_many(
+        {key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+class FeedCacheKey:
+    """Ключ фрагмента ленты: что за фрагмент и какой он версии.
+
+    Строковое представление — полный ключ с версиями, так что объект
+    можно передавать и во встроенный `{% cache %}`. `identity` без
+    версий нужен `{% feed_cache %}`, чтобы найти прошлую копию фрагмента.
+    `prepare` `{% feed_cache %}` вызывает только перед пересчётом
+    фрагмента: например, дочитать к постам страницы миниатюры.
+    """
+
+    def __init__(self, identity, versions, prepare=None):
+        self.identity = identity
+        self.versions = versions
+        self.prepare = prepare
+
+    def __str__(self):
+        return ':'.join([self.identity, *map(str, self.versions)])
+
+
+def feed_cache_key(request, scope, prepare=None):
+    """Ключ фрагмента страницы ленты для тега `{% feed_cache %}`.
+
+    Ключ строится по запросу, без чтения постов страницы, так что при
+    попадании в кэш лента не стоит ни одного запроса к постам. От
+    зрителя фрагмент не зависит: кнопки, которые видны только ему,
+    `{% feed_cache %}` подставляет уже после чтения из кэша. Из
+    параметров запроса в ключ попадает только выбранная страница, чтобы
+    посторонние параметры не плодили копии фрагмента.
+    """
+    identity = ':'.join([scope, page_identity(request)])
+    return FeedCacheKey(identity, versions(ALL, scope), prepare)
+
+
+def single_flight(key, stale_key, compute, timeout):
+    """Верни значение из кэша, пересчитывая его только в одном процессе.
+
+    Возвращает пару (значение, свежее ли оно).
+
+    Значение хранится вместе со сроком и временем расчёта и обновляется
+    заранее с вероятностью, растущей к концу срока (probabilistic early
+    expiration), чтобы ключ не истёк у всех процессов одновременно.
+    Пересчёт делает тот, кто взял блокировку `cache.add`; остальные
+    тем временем отдают прошлую копию из `stale_key`; она хранится в
+    `STALE_TIMEOUT_FACTOR` раз дольше самого значения.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, expires, delta = entry
+        beta = getattr(settings, 'FEED_CACHE_EARLY_REFRESH_BETA', 1.0)
+        if now - delta * beta * math.log(1 - random.random()) < expires:
+            return value, True
+    lock_key = LOCK_KEY.format(key)
+    lock_timeout = getattr(settings, 'FEED_CACHE_LOCK_TIMEOUT', 30)
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked:
+        if entry is not None:
+            return entry[0], True
+        stale = cache.get(stale_key)
+        if stale is not None:
+            return stale[0], False
+    try:
+        value = compute()
+        timeout = replica_timeout(timeout)
+        delta = time.time() - now
+        entry = (value, now + timeout, delta)
+        cache.set(key, entry, timeout)
+        cache.set(stale_key, entry, timeout * STALE_TIMEOUT_FACTOR)
+    finally:
+        # Чужую блокировку не трогаем: её владелец ещё считает.
+        if locked:
+            cache.delete(lock_key)
+    return value, True
+
+
+def body_validated(request, response):
+    """Поставь ответу ETag по его телу и ответь 304, если он совпал."""
+    etag = quote_etag(hashlib.md5(response.content).hexdigest())
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=0)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def anonymous_page_cache(get_scopes):
+    """Кэшируй страницу целиком для анонимных посетителей.
+
+    `get_scopes(**kwargs)` по аргументам view возвращает ленты, из
+    которых собрана страница, или None, если страницы нет. По их
+    версиям строятся ETag и Last-Modified: повторный запрос с
+    совпавшим валидатором получает `304 Not Modified` без рендеринга.
+    Версиям в кэше отдельного процесса верить нельзя, поэтому там, как и
+    для страницы с реплики, ETag — хэш готовой страницы. Страница,
+    прочитанная с реплики, в кэш не попадает.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            scopes = get_scopes(**kwargs)
+            if scopes is None:
+                return view(request, *args, **kwargs)
+            page_versions = versions(ALL, *scopes)
+            key = hashlib.md5(
+                f'{request.get_full_path()}:{page_versions}'.encode()
+            ).hexdigest()
+            last_modified = max(page_versions) // 1000
+            response = None
+            if shared_cache():
+                response = get_conditional_response(
+                    request, etag=quote_etag(key),
+                    last_modified=last_modified)
+            if response is None:
+                response = cache.get(PAGE_KEY.format(key))
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # Страницу, собранную из устаревших фрагментов, нельзя
+                # сохранять и отдавать под новым ETag.
+                if (response.status_code != 200
+                        or getattr(request, 'feed_cache_stale', False)):
+                    return response
+                # Страница с реплики могла не увидеть записи, которые уже
+                # подняли версии, поэтому её не храним.
+                if used_replica():
+                    return body_validated(request, response)
+                cache.set(PAGE_KEY.format(key), response,
+                          feed_cache_timeout())
+            if not shared_cache():
+                return body_validated(request, response)
+            response['ETag'] = quote_etag(key)
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, public=True, max_age=0)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,45 @@
+"""Денормализованные счётчики постов, комментариев и подписок."""
+from django.db.models import F
+
+from .models import Group, Post, UserStats
+from .paginators import adjust_cached_count
+
+
+def change(model, pk, field, delta):
+    """Атомарно сдвинь счётчик `field` строки `pk` на `delta`.
+
+    Уменьшение не опускает счётчик ниже нуля: если он уже разошёлся
+    с данными, его поправит `recount_counters`.
+    """
+    if pk is None:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def post_added(post, delta=1):
+    change(UserStats, post.author_id, 'post_count', delta)
+    change(Group, post.group_id, 'post_count', delta)
+    adjust_cached_count('index', delta)
+
+
+def post_moved(post, old_group_id):
+    """Перенеси пост из группы `old_group_id` в его текущую группу."""
+    if post.group_id != old_group_id:
+        change(Group, old_group_id, 'post_count', -1)
+        change(Group, post.group_id, 'post_count', 1)
+
+
+def comment_added(comment, delta=1):
+    change(Post, comment.post_id, 'comment_count', delta)
+
+
+def follows_changed(user_id, author_ids, delta=1):
+    """Сдвинь счётчики подписок пользователя и подписчиков авторов."""
+    change(UserStats, user_id, 'following_count', delta * len(author_ids))
+    authors = UserStats.objects.filter(user_id__in=author_ids)
+    if delta < 0:
+        authors = authors.filter(follower_count__gte=-delta)
+    authors.update(follower_count=F('follower_count') + delta)
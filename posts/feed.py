@@ -0,0 +1,213 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается по лентам подписчиков автора сразу после
+сохранения. Для авторов с очень большим числом подписчиков раскладка не
+делается: их посты подмешиваются в ленту при чтении (pull). Когда
+такой автор теряет подписчиков и снова укладывается в предел, он ждёт
+команды `backfill_feeds`: пока она пачками не дольёт его последние посты
+в ленты подписчиков, они по-прежнему читаются при показе ленты.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import FeedItem, Follow, Post, UserStats
+
+# Ключи курсора для ленты, читаемой из posts_feeditem.
+FEED_KEYS = ('feed_date', 'feed_post')
+PULL_AUTHORS_CACHE_KEY = 'feed:pull_authors'
+PULL_AUTHORS_CACHE_TIMEOUT = 60 * 5
+BATCH_SIZE = 500
+FEED_ITEM = FeedItem._meta.db_table
+FOLLOW = Follow._meta.db_table
+POST = Post._meta.db_table
+
+# Последние `backfill_size()` постов каждого автора из пар `edge`
+# (подписчик, автор) — в ленты подписчиков; авторы сверх предела
+# раскладки пропускаются. `{edges}` — SELECT пар.
+#
+# Подписчики считаются по самим подпискам, а не по UserStats: при
+# загрузке подписок счётчики пересчитываются только в конце. Счёт
+# останавливается на `fanout_limit() + 1`-й подписке: есть ли строка
+# с таким смещением в индексе (author, user).
+BACKFILL = f'''
+INSERT OR IGNORE INTO {FEED_ITEM} (user_id, post_id, author_id, pub_date)
+WITH edge (user_id, author_id) AS ({{edges}}),
+pull AS (
+    SELECT author_id FROM (SELECT DISTINCT author_id FROM edge) a
+    WHERE EXISTS (
+        SELECT 1 FROM {FOLLOW} f WHERE f.author_id = a.author_id
+        LIMIT 1 OFFSET %s)
+),
+recent AS (
+    SELECT id, author_id, pub_date FROM (
+        SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS place
+        FROM {POST} WHERE author_id IN (SELECT author_id FROM edge)
+        AND author_id NOT IN (SELECT author_id FROM pull)
+    ) WHERE place <= %s
+)
+SELECT e.user_id, r.id, r.author_id, r.pub_date FROM edge e
+JOIN recent r ON r.author_id = e.author_id
+'''
+
+
+def fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+
+
+def backfill_size():
+    return getattr(settings, 'FEED_BACKFILL_SIZE', 1000)
+
+
+def is_pull_author(author_id):
+    """Посты автора читаются при показе ленты, а не раскладываются."""
+    return UserStats.objects.filter(
+        user_id=author_id, follower_count__gt=fanout_limit()).exists()
+
+
+def pull_authors():
+    """Множество id авторов, чьи посты читаются при показе ленты: сверх
+    предела раскладки или ещё не разложенные `backfill_feeds`."""
+    authors = cache.get(PULL_AUTHORS_CACHE_KEY)
+    if authors is None:
+        # UNION ALL, а не OR: каждая половина идёт по своему индексу.
+        authors = set(
+            UserStats.objects.filter(follower_count__gt=fanout_limit())
+            .values_list('user_id', flat=True).union(
+                UserStats.objects.filter(
+                    feed_backfill_requested__isnull=False)
+                .values_list('user_id', flat=True), all=True))
+        cache.set(PULL_AUTHORS_CACHE_KEY, authors,
+                  PULL_AUTHORS_CACHE_TIMEOUT)
+    return authors
+
+
+def fan_out_post(post):
+    """Разложи новый пост по лентам подписчиков автора."""
+    if is_pull_author(post.author_id):
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, post_id=post.pk,
+                  author_id=post.author_id, pub_date=post.pub_date)
+         for user_id in follower_ids.iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill_follow(user_id, author_id):
+    """Добавь в ленту нового подписчика последние посты автора."""
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:backfill_size()]
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, post_id=post_id,
+                  author_id=author_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill_edges(edges):
+    """Разложи последние посты авторов по лентам подписчиков из пар
+    (подписчик, автор) одним запросом.
+
+    Пары уходят в базу одним параметром — JSON-массивом, который
+    разворачивает `json_each`, так что их число не упирается в предел
+    параметров SQLite.
+    """
+    if not edges:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(BACKFILL.format(
+            edges="SELECT json_extract(value, '$[0]'), "
+                  "json_extract(value, '$[1]') FROM json_each(%s)"),
+            [json.dumps(edges), fanout_limit(), backfill_size()])
+
+
+def authors_unfollowed(author_ids):
+    """Отметь авторов, опустившихся до предела раскладки.
+
+    Пока у автора было больше `fanout_limit()` подписчиков, его посты
+    в ленты не попадали. Отписка, после которой подписчиков ровно
+    предел, возвращает автора к раскладке, но его посты эпохи pull
+    доливает в ленты не запрос, а команда `backfill_feeds`: до неё
+    посты автора читаются при показе ленты.
+    """
+    marked = UserStats.objects.filter(
+        user_id__in=author_ids, follower_count=fanout_limit(),
+    ).update(feed_backfill_requested=timezone.now())
+    if marked:
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+
+
+def backfill_requested(batch_size):
+    """Разложи посты эпохи pull авторов, отмеченных `authors_unfollowed`.
+
+    Подписчики автора проходят пачками по `batch_size`, каждая пачка —
+    своя транзакция. Новые посты и подписки такого автора раскладываются
+    как обычно, поэтому после последней пачки отметку можно снять, если
+    автора не отметили заново. Верни число разложенных авторов.
+    """
+    requested = list(UserStats.objects.filter(
+        feed_backfill_requested__isnull=False,
+    ).values_list('user_id', 'feed_backfill_requested'))
+    for author_id, requested_at in requested:
+        last_user_id = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(Follow.objects.filter(
+                    author_id=author_id, user_id__gt=last_user_id,
+                ).order_by('user_id').values_list(
+                    'user_id', flat=True)[:batch_size])
+                backfill_edges([(user_id, author_id)
+                                for user_id in user_ids])
+            if len(user_ids) < batch_size:
+                break
+            last_user_id = user_ids[-1]
+        UserStats.objects.filter(
+            user_id=author_id, feed_backfill_requested=requested_at,
+        ).update(feed_backfill_requested=None)
+    if requested:
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+    return len(requested)
+
+
+def remove_follow(user_id, author_id):
+    """Убери посты автора из ленты отписавшегося пользователя."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_for(user):
+    """Верни (queryset, ключи курсора) ленты подписок пользователя.
+
+    Обычно это один проход по индексу posts_feeditem. Если пользователь
+    подписан на авторов с большим числом подписчиков, их посты
+    подмешиваются по `author_id`, и сортировка идёт по полям поста.
+    """
+    followed_pull = set()
+    authors = pull_authors()
+    if authors:
+        followed_pull = set(
+            Follow.objects.filter(user=user, author__in=authors)
+            .values_list('author', flat=True))
+    if not followed_pull:
+        # Аннотации ссылаются на тот же JOIN, что и фильтр, поэтому
+        # сортировка и курсор идут по индексу (user, pub_date, post).
+        post_list = Post.objects.for_feed().filter(
+            feed_entries__user=user,
+        ).annotate(
+            feed_date=F('feed_entries__pub_date'),
+            feed_post=F('feed_entries__post'),
+        ).order_by('-feed_date', '-feed_post')
+        return post_list, FEED_KEYS
+    pushed = FeedItem.objects.filter(user=user).values('post')
+    post_list = Post.objects.for_feed().filter(
+        Q(pk__in=pushed) | Q(author__in=followed_pull))
+    return post_list, ('pub_date', 'pk')
@@ -0,0 +1,74 @@
+"""Подписки одним запросом к базе.
+
+Подписка и отписка — это `INSERT ... ON CONFLICT DO NOTHING` и `DELETE`
+с `RETURNING`: повтор ничего не меняет, гонка двух запросов не упирается
+в уникальное ограничение, а база сама сообщает, какие строки на самом
+деле изменились. Для них и только для них сдвигаются счётчики,
+обновляется лента и сбрасывается кэш. Сигналы модели при этом не
+срабатывают, поэтому те же действия вызываются и из `signals.py` для
+подписок, созданных через ORM.
+"""
+from django.db import connection
+
+from . import cache, counters, feed, graph
+from .models import Follow
+
+TABLE = Follow._meta.db_table
+
+
+def followed(user_id, author_ids):
+    """Последствия новых подписок пользователя на авторов."""
+    if not author_ids:
+        return
+    counters.follows_changed(user_id, author_ids)
+    graph.changed(user_id, author_ids)
+    for author_id in author_ids:
+        feed.backfill_follow(user_id, author_id)
+    cache.bump(cache.author_scope(user_id),
+               *map(cache.author_scope, author_ids))
+
+
+def unfollowed(user_id, author_ids):
+    """Последствия отписки пользователя от авторов."""
+    if not author_ids:
+        return
+    counters.follows_changed(user_id, author_ids, -1)
+    graph.changed(user_id, author_ids, -1)
+    for author_id in author_ids:
+        feed.remove_follow(user_id, author_id)
+    feed.authors_unfollowed(author_ids)
+    cache.bump(cache.author_scope(user_id),
+               *map(cache.author_scope, author_ids))
+
+
+def follow(user_id, author_ids):
+    """Подпиши пользователя на авторов; верни id новых подписок."""
+    author_ids = [pk for pk in dict.fromkeys(author_ids) if pk != user_id]
+    if not author_ids:
+        return []
+    values = ', '.join(['(%s, %s)'] * len(author_ids))
+    params = [value for author_id in author_ids
+              for value in (user_id, author_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TABLE} (user_id, author_id) VALUES {values} '
+            f'ON CONFLICT DO NOTHING RETURNING author_id', params)
+        created = [author_id for author_id, in cursor.fetchall()]
+    followed(user_id, created)
+    return created
+
+
+def unfollow(user_id, author_ids):
+    """Отпиши пользователя от авторов; верни id снятых подписок."""
+    author_ids = list(dict.fromkeys(author_ids))
+    if not author_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE user_id = %s '
+            f'AND author_id IN ({placeholders}) RETURNING author_id',
+            [user_id, *author_ids])
+        deleted = [author_id for author_id, in cursor.fetchall()]
+    unfollowed(user_id, deleted)
+    return deleted
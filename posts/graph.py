@@ -0,0 +1,263 @@
+"""Граф подписок в памяти процесса.
+
+Отношение `Follow` хранится в двух направлениях (на кого подписан
+пользователь и кто подписан на автора) в виде CSR: отсортированный
+массив вершин, массив смещений и один общий массив соседей, все — `array`
+64-битных целых. Проверка подписки — два двоичных поиска, число соседей и их
+список — срез массива, без запросов к базе.
+
+Подписки и отписки этого процесса попадают в индекс после коммита в
+виде небольшой «добавки» поверх массивов; когда добавка вырастает, она
+вливается в массивы. Изменения из других процессов индекс видит только
+после перезагрузки, поэтому он перечитывается из базы, когда старше
+`FOLLOW_GRAPH_MAX_AGE` секунд. Включается настройкой `FOLLOW_GRAPH_INDEX`;
+без неё функции модуля отвечают запросами к базе.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow
+
+# Сколько изменений копится поверх массивов, прежде чем влиться в них.
+COMPACT_THRESHOLD = 10_000
+CHUNK_SIZE = 10_000
+
+_graph = None
+# Запись в добавку графа и чтение списков соседей из неё.
+_lock = threading.Lock()
+# Загрузку графа из базы делает один поток за раз.
+_loading = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'FOLLOW_GRAPH_INDEX', False)
+
+
+def max_age():
+    return getattr(settings, 'FOLLOW_GRAPH_MAX_AGE', 60)
+
+
+class CSR:
+    """Соседи вершин одного направления графа в трёх массивах."""
+    __slots__ = ('nodes', 'offsets', 'targets')
+
+    def __init__(self, nodes, offsets, targets):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_sorted(cls, pairs):
+        """Собери CSR из пар (вершина, сосед), отсортированных по паре."""
+        nodes, offsets, targets = array('q'), array('q', [0]), array('q')
+        for node, target in pairs:
+            if not nodes or nodes[-1] != node:
+                if nodes:
+                    offsets.append(len(targets))
+                nodes.append(node)
+            targets.append(target)
+        if nodes:
+            offsets.append(len(targets))
+        return cls(nodes, offsets, targets)
+
+    def span(self, node):
+        """Границы соседей вершины в `targets`; (0, 0) — соседей нет."""
+        index = bisect_left(self.nodes, node)
+        if index == len(self.nodes) or self.nodes[index] != node:
+            return 0, 0
+        return self.offsets[index], self.offsets[index + 1]
+
+    def has(self, node, target):
+        lo, hi = self.span(node)
+        index = bisect_left(self.targets, target, lo, hi)
+        return index < hi and self.targets[index] == target
+
+    def degree(self, node):
+        lo, hi = self.span(node)
+        return hi - lo
+
+    def neighbors(self, node):
+        lo, hi = self.span(node)
+        return self.targets[lo:hi]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+class Direction:
+    """CSR одного направления и ещё не влитые в него изменения."""
+
+    def __init__(self, csr):
+        self.csr = csr
+        self.added = {}
+        self.removed = {}
+        self.changes = 0
+
+    def has(self, node, target):
+        if target in self.added.get(node, ()):
+            return True
+        return (target not in self.removed.get(node, ())
+                and self.csr.has(node, target))
+
+    def degree(self, node):
+        return (self.csr.degree(node) + len(self.added.get(node, ()))
+                - len(self.removed.get(node, ())))
+
+    def neighbors(self, node):
+        """Отсортированный список соседей вершины."""
+        added = self.added.get(node)
+        removed = self.removed.get(node)
+        base = self.csr.neighbors(node)
+        if not added and not removed:
+            return base.tolist()
+        return sorted({*base, *(added or ())} - (removed or set()))
+
+    def add(self, node, target):
+        self.changes += 1
+        if target in self.removed.get(node, ()):
+            self.removed[node].discard(target)
+        elif not self.csr.has(node, target):
+            self.added.setdefault(node, set()).add(target)
+
+    def discard(self, node, target):
+        self.changes += 1
+        if target in self.added.get(node, ()):
+            self.added[node].discard(target)
+        elif self.csr.has(node, target):
+            self.removed.setdefault(node, set()).add(target)
+
+    def compacted(self):
+        """Новое направление, в массивы которого влиты все изменения."""
+        nodes = sorted({*self.csr.nodes, *self.added})
+        return Direction(CSR.from_sorted(
+            (node, target) for node in nodes
+            for target in self.neighbors(node)))
+
+
+class FollowGraph:
+    """Подписки в обе стороны: `following[user]` и `followers[author]`."""
+
+    def __init__(self, following, followers):
+        self.following = Direction(following)
+        self.followers = Direction(followers)
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        """Прочитай граф из базы двумя проходами по индексам подписок.
+
+        Проходы идут без общей транзакции: она заняла бы запись в базе
+        на всё чтение. Подписка, попавшая между проходами, видна только
+        в одном направлении до следующей перезагрузки.
+        """
+        following = CSR.from_sorted(
+            Follow.objects.order_by('user', 'author')
+            .values_list('user', 'author').iterator(CHUNK_SIZE))
+        followers = CSR.from_sorted(
+            Follow.objects.order_by('author', 'user')
+            .values_list('author', 'user').iterator(CHUNK_SIZE))
+        return cls(following, followers)
+
+    def apply(self, user_id, author_ids, delta):
+        with _lock:
+            for author_id in author_ids:
+                if delta > 0:
+                    self.following.add(user_id, author_id)
+                    self.followers.add(author_id, user_id)
+                else:
+                    self.following.discard(user_id, author_id)
+                    self.followers.discard(author_id, user_id)
+            if self.following.changes > COMPACT_THRESHOLD:
+                self.following = self.following.compacted()
+                self.followers = self.followers.compacted()
+
+
+def get():
+    """Текущий граф или None, если индекс выключен.
+
+    Граф загружается при первом обращении и перечитывается, когда
+    устареет; пока один поток перечитывает его, остальные отвечают по
+    прежней копии.
+    """
+    global _graph
+    if not enabled():
+        return None
+    graph = _graph
+    if graph is not None and time.monotonic() - graph.loaded_at < max_age():
+        return graph
+    if not _loading.acquire(blocking=graph is None):
+        return graph
+    try:
+        if _graph is graph:
+            _graph = FollowGraph.load()
+        return _graph
+    finally:
+        _loading.release()
+
+
+def reset():
+    """Забудь загруженный граф; он прочитается заново при обращении."""
+    global _graph
+    _graph = None
+
+
+def warm():
+    """Загрузи граф при старте процесса, если индекс включён."""
+    get()
+
+
+def changed(user_id, author_ids, delta=1):
+    """Отрази в графе подписки (или отписки) после коммита."""
+    if _graph is None or not author_ids:
+        return
+    author_ids = list(author_ids)
+    transaction.on_commit(
+        lambda: _graph is not None
+        and _graph.apply(user_id, author_ids, delta))
+
+
+def is_following(user_id, author_id):
+    graph = get()
+    if graph is None:
+        return Follow.objects.filter(
+            user_id=user_id, author_id=author_id).exists()
+    return graph.following.has(user_id, author_id)
+
+
+def followers(author_id):
+    """Отсортированные id подписчиков автора."""
+    graph = get()
+    if graph is None:
+        return list(Follow.objects.filter(author_id=author_id).order_by(
+            'user').values_list('user', flat=True))
+    with _lock:
+        return graph.followers.neighbors(author_id)
+
+
+def following(user_id):
+    """Отсортированные id авторов, на которых подписан пользователь."""
+    graph = get()
+    if graph is None:
+        return list(Follow.objects.filter(user_id=user_id).order_by(
+            'author').values_list('author', flat=True))
+    with _lock:
+        return graph.following.neighbors(user_id)
+
+
+def follower_count(author_id):
+    graph = get()
+    if graph is None:
+        return Follow.objects.filter(author_id=author_id).count()
+    return graph.followers.degree(author_id)
+
+
+def following_count(user_id):
+    graph = get()
+    if graph is None:
+        return Follow.objects.filter(user_id=user_id).count()
+    return graph.following.degree(user_id)
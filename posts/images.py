@@ -0,0 +1,71 @@
+"""Обработка загруженных картинок постов перед сохранением.
+
+Загрузка целиком пишется во временный файл (`FILE_UPLOAD_HANDLERS`), а
+Pillow декодирует JPEG сразу в уменьшенном масштабе (`draft`), поэтому
+память не зависит от размера присланной фотографии. Картинка
+поворачивается по EXIF, уменьшается до `IMAGE_MAX_SIDE` и
+перекодируется в `IMAGE_FORMAT` без метаданных.
+"""
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+# `Image.thumbnail` сначала грубо сжимает картинку (`reduce`) до размера
+# во столько раз больше итогового, а дальше — фильтром LANCZOS.
+REDUCING_GAP = 2
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 50_000_000)
+
+
+def max_side():
+    return getattr(settings, 'IMAGE_MAX_SIDE', 2560)
+
+
+def output_format():
+    return getattr(settings, 'IMAGE_FORMAT', 'WEBP')
+
+
+def shrink(upload):
+    """Верни уменьшенную и перекодированную копию загруженной картинки."""
+    side = max_side()
+    upload.seek(0)
+    with Image.open(upload) as original:
+        width, height = original.size
+        if width * height > max_pixels():
+            raise ValidationError(
+                'Картинка слишком большая: не больше %(limit)s пикселей.',
+                code='too_many_pixels', params={'limit': max_pixels()})
+        # Уменьшаем до поворота: рамка квадратная, а поворот по EXIF
+        # маленькой картинки не требует второй копии исходника в памяти.
+        original.draft(None, (side, side))
+        original.thumbnail((side, side), Image.LANCZOS,
+                           reducing_gap=REDUCING_GAP)
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            transparent = ('transparency' in image.info
+                           or image.mode in ('LA', 'PA'))
+            image = image.convert('RGBA' if transparent else 'RGB')
+        return encode(image, upload.name, original.info.get('icc_profile'))
+
+
+def encode(image, name, icc_profile=None):
+    """Запиши картинку без EXIF в файл, который держится в памяти, пока
+    он не больше `FILE_UPLOAD_MAX_MEMORY_SIZE`."""
+    image_format = output_format()
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    options = {'quality': getattr(settings, 'IMAGE_QUALITY', 82)}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    result = SpooledTemporaryFile(settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(result, image_format, **options)
+    result.seek(0)
+    return File(result, name=f'{stem}.{EXTENSIONS[image_format]}')
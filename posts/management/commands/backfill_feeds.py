@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает по лентам подписчиков посты авторов, которые '
+            'снова уложились в предел раскладки; подписчики идут '
+            'пачками, каждая пачка — своя транзакция.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, batch_size, **options):
+        count = feed.backfill_requested(batch_size)
+        self.stdout.write(f'разложено авторов: {count}')
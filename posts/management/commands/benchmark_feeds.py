@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время ответа и размер HTML-страниц лент и их '
+            'JSON-версий. Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=200)
+
+    def handle(self, *args, requests, posts, **options):
+        with transaction.atomic():
+            pages = self.seed(posts)
+            self.stdout.write(
+                f'{"лента":<10}{"HTML, мс":>10}{"JSON, мс":>10}'
+                f'{"HTML, КБ":>10}{"JSON, КБ":>10}')
+            for name, (html_url, api_url) in pages.items():
+                html_ms, html_size = self.measure(html_url, requests)
+                api_ms, api_size = self.measure(api_url, requests)
+                self.stdout.write(
+                    f'{name:<10}{html_ms:>10.2f}{api_ms:>10.2f}'
+                    f'{html_size / 1024:>10.1f}{api_size / 1024:>10.1f}')
+            transaction.set_rollback(True)
+
+    def seed(self, posts):
+        author = User.objects.create(username='benchmark_author')
+        reader = User.objects.create(username='benchmark_reader')
+        group = Group.objects.create(title='Бенчмарк', slug='benchmark')
+        Follow.objects.create(user=reader, author=author)
+        for number in range(posts):
+            Post.objects.create(text=f'Пост для замера {number} ' * 20,
+                                author=author, group=group)
+        self.client = Client()
+        self.client.force_login(reader)
+        return {
+            'index': (reverse('index'), reverse('api_index')),
+            'group': (reverse('group_posts', args=[group.slug]),
+                      reverse('api_group_posts', args=[group.slug])),
+            'profile': (reverse('profile', args=[author.username]),
+                        reverse('api_profile', args=[author.username])),
+            'follow': (reverse('follow_index'),
+                       reverse('api_follow_index')),
+        }
+
+    def measure(self, url, requests):
+        """Среднее время ответа в мс и размер ответа в байтах.
+
+        Уникальный параметр в каждом запросе не даёт отдать фрагмент
+        ленты из кэша: сравнивается именно сборка ответа.
+        """
+        size = 0
+        started = time.perf_counter()
+        for number in range(requests):
+            response = self.client.get(url, {'benchmark': number})
+            size = len(response.content)
+        elapsed = time.perf_counter() - started
+        return elapsed / requests * 1000, size
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'pub_date TEXT, text TEXT)',
+    'CREATE INDEX post_pub_date_idx ON post (pub_date)',
+)
+READ = ('SELECT id, author_id, pub_date, text FROM post '
+        'ORDER BY pub_date DESC LIMIT 10')
+WRITE = 'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)'
+# Писатель, как и view, сначала читает, а потом пишет в той же транзакции.
+LAST_POST = 'SELECT MAX(pub_date) FROM post WHERE author_id = ?'
+
+PRODUCTION_TIMEOUT = settings.DATABASES['default'].get(
+    'OPTIONS', {}).get('timeout', 5)
+PRODUCTION_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {})
+# Профиль по умолчанию: журнал отката, стандартные 5 секунд ожидания и
+# обычный BEGIN, как у встроенного бэкенда Django. «wal-deferred» — те же
+# PRAGMA, что в рабочей базе, но с обычным BEGIN; «production» — как
+# yatube.backends.sqlite3, с BEGIN IMMEDIATE.
+PROFILES = {
+    'default': {'timeout': 5, 'pragmas': {}, 'begin': 'BEGIN'},
+    'wal-deferred': {'timeout': PRODUCTION_TIMEOUT,
+                     'pragmas': PRODUCTION_PRAGMAS, 'begin': 'BEGIN'},
+    'production': {'timeout': PRODUCTION_TIMEOUT,
+                   'pragmas': PRODUCTION_PRAGMAS,
+                   'begin': 'BEGIN IMMEDIATE'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность чтения ленты при '
+            'одновременных транзакциях «прочитать и записать» для '
+            'профилей SQLite по умолчанию, WAL с обычным BEGIN '
+            'и рабочего.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"профиль":<14}{"чтений/с":>12}{"записей/с":>12}'
+            f'{"locked":>10}')
+        for name, profile in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                reads, writes, locked = self.run(path, profile, **options)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{name:<14}{reads / seconds:>12.0f}'
+                f'{writes / seconds:>12.0f}{locked:>10}')
+
+    def connect(self, path, profile):
+        conn = sqlite3.connect(path, timeout=profile['timeout'],
+                               check_same_thread=False,
+                               isolation_level=None)
+        for pragma, value in profile['pragmas'].items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def run(self, path, profile, readers, writers, seconds, rows,
+            **options):
+        conn = self.connect(path, profile)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.execute('BEGIN')
+        conn.executemany(WRITE, ((n % 100, f'{n:012}', 'текст')
+                                 for n in range(rows)))
+        conn.execute('COMMIT')
+        conn.close()
+
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def count(name):
+            with lock:
+                counts[name] += 1
+
+        def read():
+            conn = self.connect(path, profile)
+            while time.monotonic() < deadline:
+                try:
+                    conn.execute(READ).fetchall()
+                    count('reads')
+                except sqlite3.OperationalError:
+                    count('locked')
+            conn.close()
+
+        def write():
+            conn = self.connect(path, profile)
+            number = rows
+            while time.monotonic() < deadline:
+                number += 1
+                try:
+                    conn.execute(profile['begin'])
+                    conn.execute(LAST_POST, (1,)).fetchone()
+                    conn.execute(WRITE, (1, f'{number:012}', 'текст'))
+                    conn.execute('COMMIT')
+                    count('writes')
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    count('locked')
+            conn.close()
+
+        threads = ([threading.Thread(target=read) for _ in range(readers)]
+                   + [threading.Thread(target=write) for _ in range(writers)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['locked']
@@ -0,0 +1,150 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.models import Post, StoredFile
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(storage, directory):
+    """Файлы каталога хранилища: пары (имя, stat), без списка в памяти."""
+    root = storage.path(directory)
+    if not os.path.isdir(root):
+        return
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, storage.location)
+                    yield name.replace(os.sep, '/'), entry.stat()
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые не ссылается ни один '
+            'пост, и миниатюры sorl, которые больше не нужны. Файлы и '
+            'база читаются пачками, так что память не растёт с их числом.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60 * 24,
+            help='Не трогать файлы моложе стольких секунд: пост с только '
+                 'что загруженной картинкой мог ещё не сохраниться.')
+
+    def handle(self, *args, dry_run, batch_size, min_age, **options):
+        self.verbosity = options['verbosity']
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.cutoff = time.time() - min_age
+        self.storage = Post._meta.get_field('image').storage
+        self.upload_to = Post._meta.get_field('image').upload_to
+        self.verb = 'будет удалено' if dry_run else 'удалено'
+        self.collect_sources()
+        self.collect_originals()
+        self.collect_cache_files()
+
+    def report(self, what, count, size=None):
+        line = f'{what}: {self.verb} {count}'
+        if size is not None:
+            line += f' ({size / 1024 / 1024:.1f} МБ)'
+        self.stdout.write(line)
+
+    def is_fresh(self, storage, name):
+        try:
+            return os.stat(storage.path(name)).st_mtime > self.cutoff
+        except FileNotFoundError:
+            return False
+
+    def unreferenced(self, names):
+        referenced = set(Post.objects.filter(image__in=names).values_list(
+            'image', flat=True))
+        return [name for name in names if name not in referenced]
+
+    def collect_sources(self):
+        """Сотри из хранилища sorl ненужные исходники и их миниатюры."""
+        prefix = add_prefix('', 'image')
+        last_key = prefix
+        sources = thumbnails = 0
+        while True:
+            rows = list(KVStore.objects.filter(
+                key__gt=last_key, key__startswith=prefix,
+            ).order_by('key').values_list('key', 'value')[:self.batch_size])
+            if not rows:
+                break
+            last_key = rows[-1][0]
+            names = [deserialize(value)['name'] for _, value in rows]
+            names = [name for name in names
+                     if name.startswith(self.upload_to)]
+            for name in self.unreferenced(names):
+                if self.is_fresh(self.storage, name):
+                    continue
+                source = ImageFile(name, self.storage)
+                sources += 1
+                thumbnails += len(default.kvstore._get(
+                    source.key, identity='thumbnails') or [])
+                if not self.dry_run:
+                    default.kvstore.delete(source)
+        self.report('миниатюры картинок без постов', thumbnails)
+        self.report('записи sorl о картинках без постов', sources)
+
+    def collect_originals(self):
+        count = size = 0
+        files = walk(self.storage, self.upload_to)
+        for batch in chunked(files, self.batch_size):
+            stats = dict(batch)
+            # Время изменения перечитывается: пока шёл обход, файл мог
+            # снова загрузить новый пост.
+            orphans = [name for name in self.unreferenced(list(stats))
+                       if stats[name].st_mtime <= self.cutoff
+                       and not self.is_fresh(self.storage, name)]
+            for name in orphans:
+                if self.verbosity > 1:
+                    self.stdout.write(name)
+                count += 1
+                size += stats[name].st_size
+                if not self.dry_run:
+                    self.storage.delete(name)
+            if orphans and not self.dry_run:
+                StoredFile.objects.filter(name__in=orphans).delete()
+        self.report('картинки без постов', count, size)
+
+    def collect_cache_files(self):
+        """Удали файлы миниатюр, о которых не знает хранилище sorl."""
+        storage = default.storage
+        count = size = 0
+        files = walk(storage, sorl_settings.THUMBNAIL_PREFIX)
+        for batch in chunked(files, self.batch_size):
+            keys = {add_prefix(ImageFile(name, storage).key): (name, stat)
+                    for name, stat in batch}
+            known = set(KVStore.objects.filter(
+                key__in=list(keys)).values_list('key', flat=True))
+            for key, (name, stat) in keys.items():
+                if key in known or stat.st_mtime > self.cutoff:
+                    continue
+                if self.verbosity > 1:
+                    self.stdout.write(name)
+                count += 1
+                size += stat.st_size
+                if not self.dry_run:
+                    storage.delete(name)
+        self.report('файлы миниатюр без записей sorl', count, size)
@@ -0,0 +1,39 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Follow
+
+from .import_follows import guess_format
+
+
+class Command(BaseCommand):
+    help = ('Выгружает подписки потоком в CSV (user,author) или JSONL — '
+            'в формате, который читает import_follows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл или «-» для stdout.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+
+    def handle(self, *args, path, format, chunk_size, **options):
+        file_format = guess_format(path, format)
+        stream = (self.stdout if path == '-'
+                  else open(path, 'w', newline='', encoding='utf-8'))
+        edges = Follow.objects.order_by('pk').values_list(
+            'user__username', 'author__username').iterator(chunk_size)
+        try:
+            if file_format == 'jsonl':
+                for user, author in edges:
+                    stream.write(json.dumps(
+                        {'user': user, 'author': author},
+                        ensure_ascii=False) + '\n')
+            else:
+                writer = csv.writer(stream)
+                writer.writerow(('user', 'author'))
+                writer.writerows(edges)
+        finally:
+            if path != '-':
+                stream.close()
@@ -0,0 +1,52 @@
+import os
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate
+
+
+def build(name):
+    """Создай миниатюры в процессе пула; верни текст ошибки или None."""
+    try:
+        generate(name)
+    except Exception as error:
+        return f'{name}: {error}'
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Заранее создаёт недостающие миниатюры картинок всех постов '
+            'в пуле процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, processes, batch_size, **options):
+        # Дочерние процессы не должны делить соединения с родителем.
+        connections.close_all()
+        done = failed = 0
+        with Pool(processes) as pool:
+            for names in self.batches(batch_size):
+                for error in pool.imap_unordered(build, names):
+                    if error:
+                        failed += 1
+                        self.stderr.write(error)
+                    else:
+                        done += 1
+                self.stdout.write(f'готово {done}, ошибок {failed}')
+
+    def batches(self, batch_size):
+        """Имена картинок постов пачками по pk, без OFFSET."""
+        last_pk = 0
+        while True:
+            rows = list(Post.objects.exclude(image='').filter(
+                pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'image')[:batch_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield [name for _, name in rows]
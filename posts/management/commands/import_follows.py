@@ -0,0 +1,118 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as default_cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import cache, feed
+from posts.models import Follow
+
+User = get_user_model()
+# Сколько имён искать одним запросом: предел параметров SQLite.
+LOOKUP_SIZE = 900
+# Сколько найденных пользователей помнить между пачками.
+USER_CACHE_SIZE = 100_000
+
+
+def read_edges(stream, file_format):
+    """Пары (подписчик, автор) из CSV с заголовком user,author или JSONL."""
+    if file_format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                row = json.loads(line)
+                yield row['user'], row['author']
+    else:
+        for row in csv.DictReader(stream):
+            yield row['user'], row['author']
+
+
+def guess_format(path, file_format):
+    if file_format:
+        return file_format
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+class Command(BaseCommand):
+    help = ('Загружает подписки из CSV (user,author) или JSONL потоком: '
+            'имена ищутся пачками, подписки вставляются bulk_create с '
+            'пропуском уже существующих, а старые посты авторов '
+            'раскладываются по лентам одним INSERT ... SELECT; каждая '
+            'пачка — своя транзакция.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или «-» для stdin.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--chunk-size', type=int, default=20_000)
+        parser.add_argument(
+            '--no-recount', action='store_true',
+            help='Не пересчитывать счётчики подписок после загрузки.')
+        parser.add_argument(
+            '--no-backfill-feed', action='store_true',
+            help='Не раскладывать по лентам подписчиков старые посты '
+                 'авторов.')
+
+    def handle(self, *args, path, format, chunk_size, no_recount,
+               no_backfill_feed, **options):
+        file_format = guess_format(path, format)
+        try:
+            stream = (sys.stdin if path == '-'
+                      else open(path, newline='', encoding='utf-8'))
+        except OSError as error:
+            raise CommandError(error)
+        self.users = {}
+        started = time.monotonic()
+        read = written = skipped = 0
+        try:
+            edges = read_edges(stream, file_format)
+            while True:
+                chunk = list(islice(edges, chunk_size))
+                if not chunk:
+                    break
+                follows = self.resolve(chunk)
+                with transaction.atomic():
+                    # Размер одного INSERT выбирает бэкенд базы.
+                    Follow.objects.bulk_create(follows, ignore_conflicts=True)
+                    if not no_backfill_feed:
+                        feed.backfill_edges(
+                            [(follow.user_id, follow.author_id)
+                             for follow in follows])
+                read += len(chunk)
+                written += len(follows)
+                skipped += len(chunk) - len(follows)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'прочитано {read}, отправлено в базу {written}, '
+                    f'пропущено {skipped} '
+                    f'({read / max(elapsed, 1e-9) * 60:.0f} в минуту)')
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Строка {read + 1}: {error!r}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if not no_recount:
+            call_command('recount_counters', stdout=self.stdout)
+        default_cache.delete(feed.PULL_AUTHORS_CACHE_KEY)
+        cache.bump(cache.ALL)
+
+    def resolve(self, chunk):
+        """Подписки пачки; неизвестные имена и подписки на себя — мимо."""
+        if len(self.users) > USER_CACHE_SIZE:
+            self.users.clear()
+        missing = list({name for edge in chunk for name in edge}
+                       - self.users.keys())
+        for start in range(0, len(missing), LOOKUP_SIZE):
+            self.users.update(User.objects.filter(
+                username__in=missing[start:start + LOOKUP_SIZE],
+            ).values_list('username', 'pk'))
+        follows = []
+        for user, author in chunk:
+            user_id, author_id = self.users.get(user), self.users.get(author)
+            if user_id and author_id and user_id != author_id:
+                follows.append(Follow(user_id=user_id, author_id=author_id))
+        return follows
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import recompute
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации «На кого подписаться» пачками '
+            'пользователей по подпискам и общим группам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help='Сколько авторов хранить на пользователя.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, top, batch_size, **options):
+        started = time.monotonic()
+        written = recompute(top, batch_size)
+        self.stdout.write(
+            f'рекомендаций: {written} '
+            f'за {time.monotonic() - started:.1f} с')
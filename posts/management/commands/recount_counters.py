@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+# (модель со счётчиком, поле счётчика, считаемая модель, ссылка на строку)
+COUNTERS = (
+    (Post, 'comment_count', Comment, 'post'),
+    (Group, 'post_count', Post, 'group'),
+    (UserStats, 'post_count', Post, 'author'),
+    (UserStats, 'follower_count', Follow, 'author'),
+    (UserStats, 'following_count', Follow, 'user'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        self.create_missing_stats()
+        for model, field, counted, link in COUNTERS:
+            fixed = self.recount(model, field, counted, link, batch_size)
+            self.stdout.write(
+                f'{model.__name__}.{field}: исправлено {fixed}')
+
+    def create_missing_stats(self):
+        user_ids = User.objects.filter(stats__isnull=True).values_list(
+            'pk', flat=True)
+        UserStats.objects.bulk_create(
+            (UserStats(user_id=user_id) for user_id in user_ids.iterator()),
+            ignore_conflicts=True)
+
+    def recount(self, model, field, counted, link, batch_size):
+        """Пройди строки `model` по pk и поправь разошедшиеся счётчики."""
+        fixed = 0
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', field)[:batch_size])
+            if not rows:
+                return fixed
+            last_pk = rows[-1][0]
+            batch = [pk for pk, _ in rows]
+            actual = dict(
+                counted.objects.filter(**{f'{link}__in': batch})
+                .order_by().values(link).annotate(total=Count('pk'))
+                .values_list(link, 'total'))
+            drifted = [model(pk=pk, **{field: actual.get(pk, 0)})
+                       for pk, value in rows if value != actual.get(pk, 0)]
+            with transaction.atomic():
+                model.objects.bulk_update(drifted, [field])
+            fixed += len(drifted)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Удаляет затухшие строки страницы «Популярное» или, с '
+            '--rebuild, пересчитывает её по постам и комментариям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=float, default=72)
+        parser.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, max_age_hours, rebuild, **options):
+        now = timezone.now()
+        max_age = timedelta(hours=max_age_hours)
+        if rebuild:
+            count = trending.rebuild(now, max_age)
+            self.stdout.write(f'пересчитано постов: {count}')
+        else:
+            count = trending.prune(now, max_age)
+            self.stdout.write(f'удалено строк: {count}')
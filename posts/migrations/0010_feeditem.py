@@ -0,0 +1,72 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_feed(apps, schema_editor):
+    """Разложи уже опубликованные посты по лентам подписчиков.
+
+    Как и при записи: авторы больше чем с `FEED_FANOUT_LIMIT`
+    подписчиками не раскладываются, а от остальных в ленту попадают
+    последние `FEED_BACKFILL_SIZE` постов.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    fanout_limit = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+    backfill_size = getattr(settings, 'FEED_BACKFILL_SIZE', 1000)
+    author_ids = list(
+        Follow.objects.order_by().values('author_id')
+        .annotate(followers=Count('pk'))
+        .filter(followers__lte=fanout_limit)
+        .values_list('author_id', flat=True))
+    for author_id in author_ids:
+        posts = list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-pk')
+            .values_list('pk', 'pub_date')[:backfill_size])
+        follower_ids = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        FeedItem.objects.bulk_create(
+            (FeedItem(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+             for user_id in follower_ids.iterator()
+             for post_id, pub_date in posts),
+            batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_auto_20210203_0526'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
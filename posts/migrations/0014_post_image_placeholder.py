@@ -0,0 +1,26 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:33
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+fts = import_module('posts.migrations.0013_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_fts'),
+    ]
+
+    # AddField в SQLite пересоздаёт posts_post, и триггеры поиска
+    # пропадают вместе со старой таблицей (и при откате тоже).
+    operations = [
+        migrations.RunSQL(migrations.RunSQL.noop, fts.TRIGGERS),
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunSQL(fts.TRIGGERS, migrations.RunSQL.noop),
+    ]
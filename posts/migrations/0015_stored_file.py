@@ -0,0 +1,49 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:35
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+fts = import_module('posts.migrations.0013_post_fts')
+
+
+def count_references(apps, schema_editor):
+    """Заведи счётчики ссылок для картинок, загруженных раньше."""
+    Post = apps.get_model('posts', 'Post')
+    StoredFile = apps.get_model('posts', 'StoredFile')
+    references = Post.objects.exclude(image='').exclude(
+        image__isnull=True).order_by().values('image').annotate(
+        total=Count('pk')).values_list('image', 'total')
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, ref_count=total)
+         for name, total in references.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_placeholder'),
+    ]
+
+    # AlterField в SQLite пересоздаёт posts_post вместе с триггерами
+    # поиска, см. 0014.
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('ref_count', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunSQL(migrations.RunSQL.noop, fts.TRIGGERS),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Вы можете добавить изображение к своему посту', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Изображение'),
+        ),
+        migrations.RunSQL(fts.TRIGGERS, migrations.RunSQL.noop),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_backfill_requested',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -8,6 +10,7 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    post_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         """Возврати понятное отображение заголовка
@@ -15,6 +18,13 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа загружаются
+        тем же запросом, что и сами посты."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     group = models.ForeignKey(Group,
                               on_delete=models.SET_NULL,
@@ -22,6 +32,7 @@ class Post(models.Model):
                               null=True,
                               related_name='posts',
                               verbose_name='Группа',
+                              db_index=False,
                               )
     text = models.TextField(verbose_name='Текст',
                             help_text='Напишите свои мысли тут:)'
@@ -31,15 +42,37 @@ class Post(models.Model):
                                     )
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
-                               related_name='posts')
+                               related_name='posts',
+                               db_index=False)
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True, null=True,
         verbose_name='Изображение',
         help_text='Вы можете добавить изображение к своему посту')
+    # Крошечная копия картинки (data URI), пока грузится миниатюра.
+    image_placeholder = models.TextField(blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        # Составные индексы покрывают и фильтр по внешнему ключу,
+        # поэтому отдельные индексы на group_id и author_id не нужны.
+        # Индексы по возрастанию: SQLite читает их с конца и получает
+        # порядок (pub_date DESC, id DESC) без сортировки, ведь id
+        # неявно хранится последней колонкой индекса.
+        indexes = [
+            models.Index(fields=['pub_date'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+            # Для проверки, ссылается ли кто-то на файл картинки.
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         """Возврати понятное отображение заголовка
@@ -51,7 +84,8 @@ class Comment(models.Model):
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='comments',
-                             verbose_name='Пост')
+                             verbose_name='Пост',
+                             db_index=False)
     text = models.TextField(verbose_name='Текст',
                             help_text='Что вы хотели добавить или уточнить?')
     created = models.DateTimeField(verbose_name='Дата и время публикации',
@@ -62,6 +96,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         """Возврати понятное отображение заголовка
@@ -72,15 +110,134 @@ class Comment(models.Model):
 class Follow(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
-                             related_name='follower')
+                             related_name='follower',
+                             db_index=False)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
-                               related_name='following')
+                               related_name='following',
+                               db_index=False)
 
     class Meta:
+        # Поиск по user покрывает уникальный индекс (user, author).
         constraints = [
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_object')]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} -> {self.author.username}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые показываются рядом с профилем.
+
+    Обновляются через F()-выражения вместе с записью, от которой
+    зависят; расхождения исправляет команда `recount_counters`.
+    """
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    post_count = models.PositiveIntegerField(default=0)
+    # Индекс нужен для поиска авторов с большим числом подписчиков.
+    follower_count = models.PositiveIntegerField(default=0, db_index=True)
+    following_count = models.PositiveIntegerField(default=0)
+    # Когда автор вернулся в предел раскладки и ждёт, пока команда
+    # `backfill_feeds` разложит его посты эпохи pull; до этого его посты
+    # читаются при показе ленты.
+    feed_backfill_requested = models.DateTimeField(null=True, blank=True,
+                                                   db_index=True)
+
+    def __str__(self):
+        return f'{self.user}: {self.post_count}'
+
+
+class FeedItem(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Строки заполняются при публикации поста (fan-out on write), поэтому
+    чтение ленты — это один проход по индексу (user, pub_date).
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='feed')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_item')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <- {self.post_id}'
+
+
+class StoredFile(models.Model):
+    """Файл хранилища с адресацией по содержимому и число ссылок на него."""
+    name = models.CharField(max_length=255, primary_key=True)
+    ref_count = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count})'
+
+
+class Recommendation(models.Model):
+    """Автор, которого стоит предложить пользователю в «На кого
+    подписаться». Пересчитывается командой `recommend_follows`."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='recommendations',
+                             db_index=False)
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        # Показ рекомендаций — один проход по индексу (user, rank).
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'],
+                                    name='unique_recommendation_rank')]
+
+    def __str__(self):
+        return f'{self.user} ?-> {self.author_id} ({self.score})'
+
+
+class TrendingScore(models.Model):
+    """Активность вокруг поста для страницы «Популярное».
+
+    `score` — натуральный логарифм суммы весов событий (публикация,
+    комментарии), умноженных на 2 ** ((время события − эпоха) /
+    период полураспада). Порядок по нему совпадает с порядком по
+    затухающей активности в любой момент, а событие меняет строку одним
+    UPSERT; см. `posts/trending.py`.
+    """
+    post = models.OneToOneField(Post,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='trending')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score}'
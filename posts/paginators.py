@@ -0,0 +1,302 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property, lazy
+
+CURSOR_AFTER = 'after'
+CURSOR_BEFORE = 'before'
+COUNT_CACHE_TIMEOUT = 60 * 5
+# Самый большой id, который помещается в INTEGER SQLite.
+MAX_PK = 2 ** 63 - 1
+# Дальше этой страницы смещение OFFSET не помещается в целое SQLite.
+MAX_PAGE = 10 ** 15
+
+
+def encode_cursor(obj, keys=('pub_date', 'pk')):
+    """Собери токен курсора из пары (pub_date, id) записи."""
+    date_key, pk_key = keys
+    raw = f'{getattr(obj, date_key).isoformat()}|{getattr(obj, pk_key)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбери токен курсора. Для битого токена верни None.
+
+    Битым считается и токен с датой без часового пояса или с id, который
+    не поместится в INTEGER базы.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        date, pk = datetime.fromisoformat(pub_date), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if date.tzinfo is None or not -MAX_PK <= pk <= MAX_PK:
+        return None
+    return date, pk
+
+
+def seek(keys, cursor, op):
+    """Условие «строго после курсора» (`op='lt'` — для убывающего порядка,
+    `op='gt'` — для возрастающего)."""
+    # Условие `date <= d` отдельно от OR, чтобы база начала чтение
+    # индекса сразу с курсора, а не пропускала строки с начала.
+    date_key, pk_key = keys
+    date, pk = cursor
+    return Q(**{f'{date_key}__{op}e': date}) & (
+        Q(**{f'{date_key}__{op}': date}) | Q(**{f'{pk_key}__{op}': pk}))
+
+
+class CursorPage:
+    """Страница ленты для курсорной пагинации.
+
+    Повторяет ту часть интерфейса `Page`, которой пользуются шаблоны:
+    итерацию, `object_list`, `has_next`/`has_previous`, `paginator`.
+    Строки читаются при первом обращении к ним, так что страница,
+    которую целиком отдал кэш фрагмента, не стоит ни одного запроса.
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, paginator, reverse=False, after=False):
+        self.keys = (paginator.date_key, paginator.pk_key)
+        self.queryset = queryset
+        self.paginator = paginator
+        self.reverse = reverse
+        self.after = after
+
+    @cached_property
+    def window(self):
+        """(строки, есть ли следующая, есть ли предыдущая)."""
+        per_page = self.paginator.per_page
+        rows = list(self.queryset[:per_page + 1])
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if self.reverse:
+            rows.reverse()
+            return rows, True, has_more
+        return rows, has_more, self.after
+
+    @property
+    def object_list(self):
+        return self.window[0]
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.window[1]
+
+    def has_previous(self):
+        return self.window[2]
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return encode_cursor(self.object_list[-1], self.keys)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return encode_cursor(self.object_list[0], self.keys)
+        return None
+
+
+class CursorPaginator:
+    """Пагинация по ключу (pub_date, id) без OFFSET и COUNT(*).
+
+    Каждая страница читается одним запросом вида
+    `WHERE (pub_date, id) < (...) ORDER BY pub_date DESC, id DESC LIMIT n+1`,
+    поэтому её стоимость не зависит от того, насколько она глубоко.
+    `keys` — поля (или аннотации) даты и id, по которым сортируется и
+    фильтруется queryset; они же читаются с объектов для токена курсора.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        self.date_key, self.pk_key = keys
+        self.object_list = object_list.order_by(
+            f'-{self.date_key}', f'-{self.pk_key}')
+        self.per_page = int(per_page)
+
+    @cached_property
+    def count(self):
+        """Общее число записей. Считается только по явному запросу."""
+        return self.object_list.count()
+
+    def _seek(self, cursor, op):
+        return seek((self.date_key, self.pk_key), cursor, op)
+
+    def get_page(self, after=None, before=None):
+        """Верни страницу после курсора `after` или перед курсором `before`.
+
+        Без курсоров (или с битым курсором) возвращается первая страница.
+        """
+        after, before = decode_cursor(after), decode_cursor(before)
+        queryset = self.object_list
+        if before is not None:
+            queryset = queryset.filter(self._seek(before, 'gt')).order_by(
+                self.date_key, self.pk_key)
+        elif after is not None:
+            queryset = queryset.filter(self._seek(after, 'lt'))
+        return CursorPage(queryset, self, reverse=before is not None,
+                          after=after is not None)
+
+
+class CountedQuerySet:
+    """Queryset с заранее известным `count()` для обычного `Paginator`.
+
+    `Paginator` спрашивает у списка `count()` и берёт срез страницы, так
+    что подмена `count()` избавляет его от `SELECT COUNT(*)`, а в контекст
+    по-прежнему попадают настоящие `Paginator` и `Page`.
+    """
+
+    def __init__(self, queryset, count):
+        self.queryset = queryset
+        self._count = count
+
+    @property
+    def ordered(self):
+        return self.queryset.ordered
+
+    def count(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self.queryset[index]
+
+
+class LookaheadQuerySet(CountedQuerySet):
+    """Queryset страницы `number`, который вообще не считает записи.
+
+    Страница читается с одной лишней строкой: если она нашлась, у
+    страницы есть следующая, и `count()` сообщает ровно на одну запись
+    больше текущей страницы. Страница за концом списка пуста, и тогда
+    записи считаются честно, а вместо неё заранее читается последняя
+    страница: её `Paginator.get_page` и покажет.
+    """
+
+    def __init__(self, queryset, per_page, number):
+        self.bottom = (number - 1) * per_page
+        self.rows = list(queryset[self.bottom:self.bottom + per_page + 1])
+        count = self.bottom + len(self.rows)
+        if not self.rows and number > 1:
+            count = queryset.count()
+            self.bottom = max(count - 1, 0) // per_page * per_page
+            self.rows = list(queryset[self.bottom:self.bottom + per_page])
+        super().__init__(queryset, count)
+
+    def __getitem__(self, index):
+        if (isinstance(index, slice) and index.start >= self.bottom
+                and index.stop <= self.bottom + len(self.rows)):
+            return self.rows[index.start - self.bottom:
+                             index.stop - self.bottom]
+        return self.queryset[index]
+
+
+def cached_count(queryset, key, timeout=COUNT_CACHE_TIMEOUT):
+    """Число записей queryset, закэшированное на `timeout` секунд."""
+    return cache.get_or_set(f'count:{key}', queryset.count, timeout)
+
+
+def adjust_cached_count(key, delta):
+    """Сдвинь закэшированное число записей вслед за записью в базу."""
+    try:
+        cache.incr(f'count:{key}', delta)
+    except ValueError:
+        pass
+
+
+def page_number(request):
+    try:
+        return min(max(int(request.GET.get('page', 1)), 1), MAX_PAGE)
+    except (TypeError, ValueError):
+        return 1
+
+
+def page_identity(request):
+    """Какую страницу ленты выбрал запрос, в каноническом виде.
+
+    Учитываются только `?page=`, `?after=` и `?before=` и ровно так, как
+    их понимает `paginate`: остальные параметры и разное написание
+    одного и того же курсора или номера дают одну и ту же строку.
+    """
+    after = request.GET.get(CURSOR_AFTER)
+    before = request.GET.get(CURSOR_BEFORE)
+    if after or before:
+        for name, token in ((CURSOR_BEFORE, before), (CURSOR_AFTER, after)):
+            cursor = decode_cursor(token)
+            if cursor is not None:
+                date, pk = cursor
+                return f'{name}={date.isoformat()}|{pk}'
+        return 'cursor'
+    return f'page={page_number(request)}'
+
+
+def paginate(request, queryset, per_page, keys=('pub_date', 'pk'),
+             count=None):
+    """Верни пару (page, paginator) для ленты записей.
+
+    Если в запросе есть `?after=` или `?before=`, лента листается
+    курсором, иначе используется обычный `Paginator` с `?page=`.
+    `count` — уже известное (из счётчика или кэша) число записей; без
+    него страницы листаются без подсчёта, по лишней строке.
+    """
+    after = request.GET.get(CURSOR_AFTER)
+    before = request.GET.get(CURSOR_BEFORE)
+    if after or before:
+        paginator = CursorPaginator(queryset, per_page, keys)
+        return paginator.get_page(after=after, before=before), paginator
+    if count is None:
+        object_list = LookaheadQuerySet(
+            queryset, per_page, page_number(request))
+    else:
+        object_list = CountedQuerySet(queryset, count)
+    paginator = Paginator(object_list, per_page)
+    page = paginator.get_page(request.GET.get('page'))
+    if page.has_next():
+        # Токен читает последнюю строку, поэтому он ленивый: пока
+        # страница не отрисована, её строки не запрашиваются.
+        page.next_cursor = lazy(lambda: encode_cursor(page[-1], keys), str)()
+    return page, paginator
+
+
+def cursor_slice(queryset, per_page, after=None, keys=('pub_date', 'pk')):
+    """Верни (queryset страницы, курсор следующей страницы или None).
+
+    Для списков, которые листаются только вперёд («показать ещё»).
+    Страница остаётся обычным queryset, поэтому стоит два запроса: сама
+    страница и проверка, есть ли что-то после неё.
+    """
+    date_key, pk_key = keys
+    queryset = queryset.order_by(f'-{date_key}', f'-{pk_key}')
+    cursor = decode_cursor(after)
+    page = queryset
+    if cursor is not None:
+        page = queryset.filter(seek(keys, cursor, 'lt'))
+    page = page[:per_page]
+    rows = list(page)
+    if len(rows) < per_page:
+        return page, None
+    last = (getattr(rows[-1], date_key), getattr(rows[-1], pk_key))
+    if not queryset.filter(seek(keys, last, 'lt')).exists():
+        return page, None
+    return page, encode_cursor(rows[-1], keys)
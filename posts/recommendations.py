@@ -0,0 +1,127 @@
+"""Рекомендации «На кого подписаться», посчитанные заранее.
+
+Оценка кандидата складывается из двух разреженных произведений:
+«друзья друзей» (F·F по матрице подписок: сколько авторов из подписок
+пользователя подписаны на кандидата) и общие группы (I·Gᵀ: в скольких
+группах, где пишет пользователь или его авторы, кандидат — один из
+самых активных авторов). Оба произведения — соединения с GROUP BY,
+которые SQLite выполняет над целыми пачками пользователей сразу, без
+цикла по пользователям в Python.
+Лучшие `top` кандидатов каждого пользователя сохраняются в
+`posts_recommendation`, и страница читает их одним запросом по индексу.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from .models import Follow, Post, Recommendation
+
+User = get_user_model()
+
+FOLLOW = Follow._meta.db_table
+POST = Post._meta.db_table
+RECOMMENDATION = Recommendation._meta.db_table
+# Пары (автор, группа), в которых автор писал, и самые активные авторы
+# каждой группы; строятся раз на пересчёт.
+AUTHOR_GROUPS = 'recommend_author_groups'
+GROUP_AUTHORS = 'recommend_group_authors'
+# Сколько авторов группы становятся кандидатами: без предела большая
+# группа даёт каждому её читателю тысячи кандидатов.
+GROUP_CANDIDATES = 50
+
+FRIEND_WEIGHT = 1.0
+GROUP_WEIGHT = 0.5
+
+CLEANUP = (
+    f'DROP TABLE IF EXISTS temp.{AUTHOR_GROUPS}',
+    f'DROP TABLE IF EXISTS temp.{GROUP_AUTHORS}',
+)
+PREPARE = (
+    *CLEANUP,
+    f'CREATE TEMP TABLE {AUTHOR_GROUPS} AS SELECT author_id, group_id, '
+    f'COUNT(*) AS posts FROM {POST} WHERE group_id IS NOT NULL '
+    f'GROUP BY author_id, group_id',
+    f'CREATE INDEX temp.{AUTHOR_GROUPS}_author '
+    f'ON {AUTHOR_GROUPS} (author_id, group_id)',
+    f'CREATE TEMP TABLE {GROUP_AUTHORS} AS SELECT group_id, author_id '
+    f'FROM (SELECT group_id, author_id, ROW_NUMBER() OVER ('
+    f'PARTITION BY group_id ORDER BY posts DESC, author_id) AS place '
+    f'FROM {AUTHOR_GROUPS}) WHERE place <= {GROUP_CANDIDATES}',
+    f'CREATE INDEX temp.{GROUP_AUTHORS}_group '
+    f'ON {GROUP_AUTHORS} (group_id, author_id)',
+)
+
+SCORE = f'''
+INSERT INTO {RECOMMENDATION} (user_id, author_id, score, rank)
+WITH interest (user_id, group_id) AS (
+    SELECT author_id, group_id FROM {AUTHOR_GROUPS}
+    WHERE author_id BETWEEN %s AND %s
+    UNION
+    SELECT f.user_id, ag.group_id FROM {FOLLOW} f
+    JOIN {AUTHOR_GROUPS} ag ON ag.author_id = f.author_id
+    WHERE f.user_id BETWEEN %s AND %s
+), candidate (user_id, author_id, score) AS (
+    SELECT f1.user_id, f2.author_id, %s FROM {FOLLOW} f1
+    JOIN {FOLLOW} f2 ON f2.user_id = f1.author_id
+    WHERE f1.user_id BETWEEN %s AND %s
+    UNION ALL
+    SELECT i.user_id, ga.author_id, %s FROM interest i
+    JOIN {GROUP_AUTHORS} ga ON ga.group_id = i.group_id
+), scored AS (
+    SELECT user_id, author_id, SUM(score) AS score FROM candidate c
+    WHERE author_id != user_id AND NOT EXISTS (
+        SELECT 1 FROM {FOLLOW} f
+        WHERE f.user_id = c.user_id AND f.author_id = c.author_id)
+    GROUP BY user_id, author_id
+), ranked AS (
+    SELECT user_id, author_id, score, ROW_NUMBER() OVER (
+        PARTITION BY user_id ORDER BY score DESC, author_id) AS rank
+    FROM scored
+)
+SELECT user_id, author_id, score, rank FROM ranked WHERE rank <= %s
+'''
+
+
+def user_batches(batch_size):
+    """Границы (первый id, последний id) пачек пользователей."""
+    last_pk = 0
+    while True:
+        ids = list(User.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_pk = ids[-1]
+        yield ids[0], ids[-1]
+
+
+def recompute(top, batch_size):
+    """Пересчитай рекомендации всех пользователей; верни число строк.
+
+    Каждая пачка пользователей заменяется в своей транзакции, так что
+    страницы всё время видят либо старые, либо новые рекомендации.
+    """
+    written = 0
+    with connection.cursor() as cursor:
+        for statement in PREPARE:
+            cursor.execute(statement)
+        try:
+            for low, high in user_batches(batch_size):
+                with transaction.atomic():
+                    Recommendation.objects.filter(
+                        user__gte=low, user__lte=high).delete()
+                    cursor.execute(SCORE, [
+                        low, high, low, high, FRIEND_WEIGHT,
+                        low, high, GROUP_WEIGHT, top])
+                    written += cursor.rowcount
+        finally:
+            for statement in CLEANUP:
+                cursor.execute(statement)
+    return written
+
+
+def for_user(user, limit):
+    """Рекомендованные пользователю авторы, на которых он ещё не подписан."""
+    return [
+        recommendation.author for recommendation in
+        Recommendation.objects.filter(user=user).exclude(
+            author__in=Follow.objects.filter(user=user).values('author'),
+        ).select_related('author').order_by('rank')[:limit]]
@@ -0,0 +1,52 @@
+"""Полнотекстовый поиск по постам через индекс SQLite FTS5.
+
+Индекс `posts_post_fts` хранит только токены текста (external content
+над `posts_post`) и поддерживается триггерами базы, поэтому в него
+попадают и посты, созданные в обход ORM-сигналов (`bulk_create`,
+`update`, raw SQL).
+"""
+import re
+
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+MATCH_IDS = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+
+def fts_query(text):
+    """Преврати ввод пользователя в безопасный запрос FTS5.
+
+    Каждое слово берётся в кавычки, чтобы операторы и спецсимволы FTS5
+    не ломали запрос; последнее слово ищется по префиксу. Для пустого
+    запроса возвращается None.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching(queryset, text):
+    """Отфильтруй queryset постов по совпадению с индексом."""
+    query = fts_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(MATCH_IDS, (query,)))
+
+
+def search_posts(text):
+    """Посты, подходящие под запрос, от самых релевантных (bm25)."""
+    query = fts_query(text)
+    if query is None:
+        return Post.objects.none()
+    return Post.objects.for_feed().extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id', f'{FTS_TABLE} MATCH %s'],
+        params=[query],
+        select={'rank': f'{FTS_TABLE}.rank'},
+        order_by=['rank', '-pub_date'],
+    )
@@ -0,0 +1,88 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache, counters, feed, follows, trending
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+# id постов, которые удаляются в этом потоке прямо сейчас: их
+# комментарии уходят каскадом, и счётчик удаляемого поста трогать незачем.
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.post_added(instance)
+        trending.post_added(instance)
+        feed.fan_out_post(instance)
+        cache.bump(*cache.post_scopes(instance))
+    else:
+        # Пост мог сменить группу, а старую группу здесь уже не узнать.
+        cache.bump(cache.ALL)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    counters.post_added(instance, -1)
+    if instance.image:
+        instance.image.storage.release(instance.image.name)
+    cache.bump(*cache.post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+        trending.comment_added(instance)
+    cache.bump(*cache.post_scopes(instance.post))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        # Ленты поста сбросит post_deleted.
+        return
+    counters.comment_added(instance, -1)
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author', 'group').first()
+    if post is not None:
+        cache.bump(*cache.post_scopes(post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    cache.bump(cache.ALL)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        follows.followed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, [instance.author_id])
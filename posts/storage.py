@@ -0,0 +1,72 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого, поэтому одинаковые загрузки
+(перепосты мемов) хранятся один раз, а миниатюры sorl, которые
+строятся по имени исходника, общие у всех постов с этой картинкой.
+Сколько постов ссылается на файл, хранит `StoredFile`: файл и его
+миниатюры удаляются, когда отпускают последнюю ссылку.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        """Сохрани файл под именем `<каталог>/<хэш[:2]>/<хэш><расширение>`
+        и добавь ему ссылку. Уже сохранённый файл не перезаписывается,
+        а только получает новое время изменения."""
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), hexdigest[:2],
+                              hexdigest + extension)
+        try:
+            # Повтор загрузки: свежее время изменения не даст
+            # `collect_media_garbage` удалить файл, пока пост с ним ещё
+            # не сохранён.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            name = self._save(name, content)
+        self.retain(name)
+        return name
+
+    def retain(self, name):
+        from .models import StoredFile
+
+        updated = StoredFile.objects.filter(name=name).update(
+            ref_count=F('ref_count') + 1)
+        if not updated:
+            StoredFile.objects.get_or_create(name=name)
+
+    def release(self, name):
+        """Убери ссылку на файл; файл без ссылок удали после коммита."""
+        from .models import StoredFile
+
+        if not name:
+            return
+        updated = StoredFile.objects.filter(
+            name=name, ref_count__gt=1).update(ref_count=F('ref_count') - 1)
+        if updated:
+            return
+        deleted, _ = StoredFile.objects.filter(name=name).delete()
+        if deleted:
+            transaction.on_commit(lambda: self.delete_with_thumbnails(name))
+
+    def delete_with_thumbnails(self, name):
+        from sorl.thumbnail import delete
+        from sorl.thumbnail.images import ImageFile
+
+        delete(ImageFile(name, self))
@@ -0,0 +1,95 @@
+import re
+
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from posts.cache import single_flight
+
+register = template.Library()
+# Внутри `{% feed_cache %}` кнопки поста не рисуются, а оставляют метку:
+# фрагмент один на всех, а кнопки подставляются для каждого зрителя.
+DEFERRED = 'feed_cache_deferred'
+CONTROLS_MARK = '<!--post-controls {author_id} {post_url} {edit_url}-->'
+CONTROLS_RE = re.compile(r'<!--post-controls (\d+) (\S+) (\S+)-->')
+
+
+def render_controls(user, author_id, post_url, edit_url):
+    return render_to_string('includes/post_controls.html', {
+        'user': user, 'author_id': author_id,
+        'post_url': post_url, 'edit_url': edit_url})
+
+
+def fill_controls(html, user):
+    """Замени метки фрагмента кнопками для пользователя `user`."""
+    return CONTROLS_RE.sub(
+        lambda match: render_controls(
+            user, int(match[1]), match[2], match[3]), html)
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time_var, fragment_name, key_var):
+        self.nodelist = nodelist
+        self.expire_time_var = expire_time_var
+        self.fragment_name = fragment_name
+        self.key_var = key_var
+
+    def render(self, context):
+        expire_time = self.expire_time_var.resolve(context)
+        key = self.key_var.resolve(context)
+
+        def compute():
+            if key.prepare is not None:
+                key.prepare()
+            with context.push({DEFERRED: True}):
+                return self.nodelist.render(context)
+
+        value, fresh = single_flight(
+            make_template_fragment_key(self.fragment_name, [key]),
+            make_template_fragment_key(self.fragment_name, [key.identity]),
+            compute, int(expire_time))
+        request = context.get('request')
+        if not fresh and request is not None:
+            request.feed_cache_stale = True
+        return mark_safe(fill_controls(value, context.get('user')))
+
+
+@register.tag('feed_cache')
+def do_feed_cache(parser, token):
+    """Как `{% cache %}`, но с защитой от одновременного пересчёта.
+
+    Использование::
+
+        {% feed_cache время имя_фрагмента ключ %}
+            ...
+        {% endfeed_cache %}
+
+    `ключ` — `FeedCacheKey` из `posts.cache.feed_cache_key`. Кнопки
+    `{% post_controls %}` внутри блока хранятся в кэше метками и
+    рисуются для каждого зрителя заново, так что фрагмент общий.
+    """
+    nodelist = parser.parse(('endfeed_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) != 4:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' принимает время, имя фрагмента и ключ.")
+    return FeedCacheNode(nodelist, parser.compile_filter(tokens[1]),
+                         tokens[2], parser.compile_filter(tokens[3]))
+
+
+@register.simple_tag(takes_context=True)
+def post_controls(context, post):
+    """Кнопки карточки поста для того, кто смотрит страницу."""
+    urls = {
+        'post_url': reverse('post', args=[post.author.username, post.pk]),
+        'edit_url': reverse('post_edit',
+                            args=[post.author.username, post.pk]),
+    }
+    if context.get(DEFERRED):
+        return mark_safe(CONTROLS_MARK.format(
+            author_id=post.author_id, **urls))
+    return mark_safe(render_controls(
+        context.get('user'), post.author_id, **urls))
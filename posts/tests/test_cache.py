@@ -0,0 +1,94 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from posts.cache import (LOCAL_FEED_CACHE_TIMEOUT, LOCK_KEY,
+                         STALE_TIMEOUT_FACTOR, feed_cache_key,
+                         feed_cache_timeout, single_flight)
+
+
+class FeedCacheTimeoutTest(TestCase):
+    @override_settings(FEED_CACHE_TIMEOUT=60 * 60 * 6)
+    def test_local_cache_keeps_short_timeout(self):
+        """С кэшем в памяти процесса фрагменты живут недолго."""
+        self.assertEqual(feed_cache_timeout(), LOCAL_FEED_CACHE_TIMEOUT)
+
+    @override_settings(FEED_CACHE_TIMEOUT=60 * 60 * 6, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_shared_cache_keeps_configured_timeout(self):
+        """С общим кэшем действует срок из настроек."""
+        self.assertEqual(feed_cache_timeout(), 60 * 60 * 6)
+
+
+class FeedCacheKeyTest(TestCase):
+    def identity(self, query):
+        request = RequestFactory().get('/', query)
+        return feed_cache_key(request, 'index').identity
+
+    def test_unknown_params_share_one_fragment(self):
+        """Посторонние параметры запроса не создают новых фрагментов."""
+        self.assertEqual(self.identity({'page': '2', 'utm': 'x'}),
+                         self.identity({'page': '2', 'junk': 'y'}))
+        self.assertEqual(self.identity({}), self.identity({'page': '1'}))
+        self.assertEqual(self.identity({'page': 'abc'}), self.identity({}))
+
+    def test_pages_and_cursors_get_own_fragments(self):
+        """Разные страницы и курсоры хранятся отдельно."""
+        self.assertNotEqual(self.identity({'page': '2'}), self.identity({}))
+        self.assertNotEqual(
+            self.identity({'after': 'broken'}), self.identity({}))
+        self.assertEqual(self.identity({'after': 'broken'}),
+                         self.identity({'before': 'junk'}))
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+    def test_value_is_computed_once(self):
+        """Значение считается один раз и дальше берётся из кэша."""
+        self.assertEqual(single_flight('key', 'stale', self.compute, 60),
+                         ('value 1', True))
+        self.assertEqual(single_flight('key', 'stale', self.compute, 60),
+                         ('value 1', True))
+        self.assertEqual(self.calls, 1)
+
+    def test_waiting_process_serves_stale_value(self):
+        """Пока другой процесс считает значение, отдаётся прошлая копия."""
+        single_flight('old-key', 'stale', self.compute, 60)
+        cache.add(LOCK_KEY.format('new-key'), 1)
+        self.assertEqual(single_flight('new-key', 'stale', self.compute, 60),
+                         ('value 1', False))
+        self.assertEqual(self.calls, 1)
+
+    def test_expiring_value_is_refreshed_by_one_process(self):
+        """Истекающее значение обновляет только владелец блокировки."""
+        cache.set('key', ('old', time.time() - 1, 0.1), 60)
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(single_flight('key', 'stale', self.compute, 60),
+                         ('old', True))
+        cache.delete(LOCK_KEY.format('key'))
+        self.assertEqual(single_flight('key', 'stale', self.compute, 60),
+                         ('value 1', True))
+
+    def test_foreign_lock_is_left_alone(self):
+        """Процесс без блокировки не снимает чужую блокировку."""
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(single_flight('key', 'stale', self.compute, 60),
+                         ('value 1', True))
+        self.assertEqual(cache.get(LOCK_KEY.format('key')), 1)
+
+    def test_stale_copy_expires(self):
+        """Прошлая копия значения хранится ограниченное время."""
+        with mock.patch('posts.cache.cache.set') as cache_set:
+            single_flight('key', 'stale', self.compute, 60)
+        cache_set.assert_any_call(
+            'stale', mock.ANY, 60 * STALE_TIMEOUT_FACTOR)
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from posts.models import Post
+from yatube.backends.sqlite3.base import DatabaseWrapper
+from yatube.db_router import (PIN_COOKIE, PRIMARY, ReplicaPinMiddleware,
+                              ReplicaRouter, read_from_replica)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_view(self, view, cookies=None):
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_only_marked_views_read_from_replica(self):
+        """С реплик читают только view под `read_from_replica`."""
+        seen = {}
+
+        def plain(request):
+            seen['plain'] = self.router.db_for_read(Post)
+            return HttpResponse()
+
+        @read_from_replica
+        def feed(request):
+            seen['feed'] = self.router.db_for_read(Post)
+            return HttpResponse()
+
+        self.run_view(plain)
+        self.run_view(feed)
+        self.assertEqual(seen, {'plain': PRIMARY, 'feed': 'replica1'})
+
+    def test_write_pins_reads_to_primary(self):
+        """После записи запрос и следующие за ним читают основную базу."""
+        seen = []
+
+        @read_from_replica
+        def feed(request):
+            self.router.db_for_write(Post)
+            seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = self.run_view(feed)
+        self.assertEqual(seen, [PRIMARY])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        @read_from_replica
+        def next_feed(request):
+            seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        self.run_view(next_feed, {PIN_COOKIE: '1'})
+        self.assertEqual(seen, [PRIMARY, PRIMARY])
+
+    def test_only_posts_app_reads_from_replica(self):
+        """Пользователи и сессии читаются из основной базы и в ленте."""
+        seen = {}
+
+        @read_from_replica
+        def feed(request):
+            seen.update({model.__name__: self.router.db_for_read(model)
+                         for model in (Post, get_user_model(), Session)})
+            return HttpResponse()
+
+        self.run_view(feed)
+        self.assertEqual(seen, {'Post': 'replica1', 'User': PRIMARY,
+                                'Session': PRIMARY})
+
+    def test_migrations_run_on_primary_only(self):
+        self.assertTrue(self.router.allow_migrate(PRIMARY, 'posts'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'posts'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaFileTest(TransactionTestCase):
+    """Основная база и настоящий файл реплики, который копирует
+    `sync_replicas`."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        connections.databases['replica1'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(self.directory.name, 'replica.sqlite3'),
+        }
+        self.author = get_user_model().objects.create(username='author')
+        self.post = Post.objects.create(text='Старый текст',
+                                        author=self.author)
+        call_command('sync_replicas', stdout=StringIO())
+
+    def tearDown(self):
+        connections['replica1'].close()
+        del connections.databases['replica1']
+        delattr(connections._connections, 'replica1')
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_feed_reads_replica_and_session_reads_primary(self):
+        """Лента — с реплики, а вход, сделанный после синхронизации, —
+        из основной базы."""
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        client = Client()
+        client.force_login(get_user_model().objects.create(username='new'))
+        response = client.get(reverse('index'))
+        self.assertTrue(response.context['user'].is_authenticated)
+        self.assertContains(response, 'Старый текст')
+        self.assertNotContains(response, 'Новый текст')
+
+        call_command('sync_replicas', stdout=StringIO())
+        with self.after_sync_interval():
+            response = client.get(reverse('index'))
+        self.assertContains(response, 'Новый текст')
+
+    def test_anonymous_page_from_replica_is_not_kept(self):
+        """Страница, собранная с отстающей реплики, не остаётся в кэше
+        под новой версией ленты."""
+        Post.objects.create(text='Свежий пост', author=self.author)
+        client = Client()
+        response = client.get(reverse('index'))
+        self.assertNotContains(response, 'Свежий пост')
+
+        call_command('sync_replicas', stdout=StringIO())
+        with self.after_sync_interval():
+            response = client.get(reverse('index'))
+        self.assertContains(response, 'Свежий пост')
+
+    def after_sync_interval(self):
+        """Промотай часы кэша на интервал синхронизации реплик."""
+        now = time.time()
+        return mock.patch('time.time', return_value=now + 1 + getattr(
+            settings, 'REPLICA_SYNC_INTERVAL', 5))
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def test_transaction_takes_write_lock_at_begin(self):
+        """Транзакция сразу занимает запись, а не на первом INSERT."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, 'NAME': path}, 'backend_test')
+            try:
+                wrapper.ensure_connection()
+                wrapper._start_transaction_under_autocommit()
+                other = sqlite3.connect(path, timeout=0)
+                with self.assertRaisesMessage(
+                        sqlite3.OperationalError, 'locked'):
+                    other.execute('BEGIN IMMEDIATE')
+                other.close()
+                wrapper.cursor().execute('ROLLBACK')
+            finally:
+                wrapper.close()
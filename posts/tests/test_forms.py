@@ -1,12 +1,23 @@
+import os
 import shutil
 import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
 
-from posts.models import Group, Post
+from posts.forms import PostForm
+from posts.models import Group, Post, StoredFile
+from posts.thumbnails import POST_THUMBNAILS, generate
 
 
 class CreateFormTests(TestCase):
@@ -25,6 +36,7 @@ class CreateFormTests(TestCase):
                         b'\x00\x00\x00\x2C\x00\x00\x00\x00'
                         b'\x02\x00\x01\x00\x00\x02\x02\x0C'
                         b'\x0A\x00\x3B')
+        cls.small_01_gif = small_01_gif
         cls.uploaded = SimpleUploadedFile(
             name='small_01.gif',
             content=small_01_gif,
@@ -83,3 +95,179 @@ class CreateFormTests(TestCase):
         self.assertEqual(self.post.text, form_data['text'])
         self.assertEqual(self.post.group.id, form_data['group'])
         self.assertEqual(response.status_code, 200)
+
+    def test_new_post_schedules_thumbnails(self):
+        """Миниатюры новой картинки заказываются сразу после сохранения."""
+        with mock.patch('posts.views.schedule_thumbnails') as schedule:
+            self.authorized_client.post(reverse('new_post'), data={
+                'text': 'С картинкой',
+                'image': SimpleUploadedFile('new.gif', self.small_01_gif)})
+        post = Post.objects.get(text='С картинкой')
+        schedule.assert_called_once_with(post.image.name)
+
+    def test_generate_creates_template_thumbnails(self):
+        """Заготовленные миниатюры совпадают с теми, что просит шаблон."""
+        generate(self.post.image.name)
+        for geometry, options in POST_THUMBNAILS:
+            thumbnail = get_thumbnail(self.post.image, geometry, **options)
+            self.assertTrue(default.kvstore.get(thumbnail))
+            self.assertTrue(thumbnail.exists())
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_placeholder.startswith(
+            'data:image/jpeg;base64,'))
+
+
+class ImageUploadTests(TestCase):
+    @staticmethod
+    def photo(size, orientation=None):
+        """JPEG-снимок с EXIF, как с камеры телефона."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        if orientation:
+            exif[0x0112] = orientation
+        content = BytesIO()
+        Image.new('RGB', size, 'red').save(content, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', content.getvalue(),
+                                  content_type='image/jpeg')
+
+    def clean_image(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        return form, form.is_valid() and form.cleaned_data['image']
+
+    @override_settings(IMAGE_MAX_SIDE=100, IMAGE_FORMAT='WEBP')
+    def test_upload_is_downscaled_rotated_and_reencoded(self):
+        """Снимок уменьшается, поворачивается по EXIF и теряет метаданные."""
+        form, image = self.clean_image(self.photo((400, 200), orientation=6))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(image.name, 'photo.webp')
+        with Image.open(image) as result:
+            self.assertEqual(result.format, 'WEBP')
+            self.assertEqual(result.size, (50, 100))
+            self.assertEqual(len(result.getexif()), 0)
+
+    @override_settings(IMAGE_MAX_PIXELS=10_000)
+    def test_upload_with_too_many_pixels_is_rejected(self):
+        """Картинка больше предела по пикселям не принимается."""
+        form, _ = self.clean_image(self.photo((200, 100)))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+
+# Миниатюры создаются сразу: фоновый поток писал бы в базу SQLite в
+# памяти одновременно с тестом, а её таблицы блокируются без ожидания.
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(),
+                   THUMBNAIL_BACKGROUND_WORKERS=0)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = get_user_model().objects.create_user(username='meme')
+        content = BytesIO()
+        Image.new('RGB', (20, 10), 'green').save(content, 'PNG')
+        cls.content = content.getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def repost(self, text):
+        self.client.post(reverse('new_post'), data={
+            'text': text,
+            'image': SimpleUploadedFile('meme.png', self.content)})
+        return Post.objects.get(text=text)
+
+    def test_same_upload_is_stored_once(self):
+        """Одинаковые загрузки хранятся одним файлом с числом ссылок."""
+        first, second = self.repost('Первый'), self.repost('Второй')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            StoredFile.objects.get(name=first.image.name).ref_count, 2)
+
+    @mock.patch('posts.storage.transaction.on_commit', lambda func: func())
+    def test_file_is_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последним постом."""
+        first, second = self.repost('Первый'), self.repost('Второй')
+        storage, name = first.image.storage, first.image.name
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_repeated_upload_protects_file_from_collection(self):
+        """Повторная загрузка старого файла без ссылок освежает его, и
+        сборщик мусора файл не трогает."""
+        name = self.repost('Первый').image.name
+        storage = Post._meta.get_field('image').storage
+        os.utime(storage.path(name), (0, 0))
+        Post.objects.update(image='')
+        self.assertEqual(self.repost('Второй').image.name, name)
+        self.assertGreater(os.stat(storage.path(name)).st_mtime,
+                           time.time() - 60)
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        # Записи sorl в кэше пережили откат базы после прошлого теста.
+        cache.clear()
+        user = get_user_model().objects.create_user(username='author')
+        self.posts = []
+        for color in ('red', 'blue'):
+            content = BytesIO()
+            Image.new('RGB', (20, 10), color).save(content, 'PNG')
+            post = Post.objects.create(
+                text=color, author=user,
+                image=SimpleUploadedFile('image.png', content.getvalue()))
+            generate(post.image.name)
+            self.posts.append(post)
+        self.storage = default.storage
+        self.stray = self.storage.save('cache/00/00/stray.jpg',
+                                       BytesIO(b'stray'))
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media_garbage', '--min-age=0', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_unreferenced_files_are_deleted(self):
+        """Удаляются только картинки без постов и лишние миниатюры."""
+        kept, dropped = self.posts
+        geometry, options = POST_THUMBNAILS[0]
+        kept_thumbnail = get_thumbnail(kept.image, geometry, **options)
+        dropped_thumbnail = get_thumbnail(dropped.image, geometry, **options)
+        # Обход сигналов: файл остаётся на диске без ссылок.
+        Post.objects.filter(pk=dropped.pk).update(image='')
+        self.collect()
+        self.assertTrue(kept.image.storage.exists(kept.image.name))
+        self.assertTrue(kept_thumbnail.exists())
+        self.assertFalse(dropped.image.storage.exists(dropped.image.name))
+        self.assertFalse(dropped_thumbnail.exists())
+        self.assertFalse(self.storage.exists(self.stray))
+
+    def test_dry_run_only_reports(self):
+        """С --dry-run ничего не удаляется, а выводится отчёт."""
+        dropped = self.posts[1]
+        Post.objects.filter(pk=dropped.pk).update(image='')
+        report = self.collect('--dry-run')
+        self.assertIn('картинки без постов: будет удалено 1', report)
+        self.assertIn('файлы миниатюр без записей sorl: будет удалено 1',
+                      report)
+        self.assertTrue(dropped.image.storage.exists(dropped.image.name))
+        self.assertTrue(self.storage.exists(self.stray))
@@ -1,7 +1,19 @@
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+import os
+import tempfile
+
+from django.apps import apps
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from posts.models import Post, Group
+from posts import follows, graph
+from posts.models import (Comment, FeedItem, Follow, Group, Post,
+                          UserStats)
 
 
 class PostModelTest(TestCase):
@@ -58,3 +70,232 @@ class GroupModelTest(TestCase):
         """Метод '__str__' совпадает с ожидаемым."""
         group = GroupModelTest.group
         self.assertEqual(str(group), group.title)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-group',
+            description='Текстовое описание',
+        )
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_counters_follow_writes_and_deletes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(self.author.stats, post_count=1,
+                            follower_count=1, following_count=0)
+        self.assertCounters(self.reader.stats, following_count=1)
+        self.assertCounters(self.group, post_count=1)
+        self.assertCounters(post, comment_count=1)
+
+        comment.delete()
+        follow.delete()
+        self.assertCounters(post, comment_count=0)
+        self.assertCounters(self.author.stats, follower_count=0)
+        post.delete()
+        self.assertCounters(self.author.stats, post_count=0)
+        self.assertCounters(self.group, post_count=0)
+
+    def test_post_delete_skips_comment_counters(self):
+        """Каскад комментариев не пересчитывает счётчик удаляемого поста."""
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text=str(number))
+            for number in range(3))
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        self.assertFalse([query for query in queries
+                          if 'comment_count' in query['sql']])
+        self.assertCounters(self.author.stats, post_count=0)
+
+    def test_recount_counters_fixes_drift(self):
+        """Команда recount_counters восстанавливает счётчики."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group)
+        Post.objects.update(comment_count=5)
+        Group.objects.update(post_count=0)
+        UserStats.objects.filter(user=self.author).delete()
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertCounters(post, comment_count=0)
+        self.assertCounters(self.group, post_count=1)
+        self.assertEqual(UserStats.objects.get(user=self.author).post_count, 1)
+
+
+class FollowGraphCommandsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.users = [User.objects.create(username=name)
+                     for name in ('anna', 'boris', 'vera')]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_import_follows_skips_unknown_self_and_duplicates(self):
+        """import_follows пропускает лишние строки и пересчитывает счётчики."""
+        path = self.write('follows.csv', (
+            'user,author\n'
+            'anna,boris\nanna,vera\nboris,vera\n'
+            'anna,boris\nanna,anna\nanna,nobody\n'))
+        call_command('import_follows', path, chunk_size=2,
+                     stdout=StringIO())
+        call_command('import_follows', path, stdout=StringIO())
+        self.assertEqual(
+            set(Follow.objects.values_list(
+                'user__username', 'author__username')),
+            {('anna', 'boris'), ('anna', 'vera'), ('boris', 'vera')})
+        vera = self.users[2]
+        vera.stats.refresh_from_db()
+        self.assertEqual(vera.stats.follower_count, 2)
+
+    @override_settings(FEED_BACKFILL_SIZE=2)
+    def test_import_follows_backfills_feeds(self):
+        """import_follows раскладывает последние посты авторов по лентам."""
+        anna, boris, vera = self.users
+        posts = [Post.objects.create(text=str(number), author=boris)
+                 for number in range(3)]
+        Post.objects.create(text='Вера', author=vera)
+        path = self.write('follows.csv', 'user,author\nanna,boris\n')
+        call_command('import_follows', path, stdout=StringIO())
+        self.assertEqual(
+            set(FeedItem.objects.filter(user=anna).values_list(
+                'post', flat=True)),
+            {posts[1].pk, posts[2].pk})
+
+        path = self.write('more.csv', 'user,author\nanna,vera\n')
+        call_command('import_follows', path, '--no-backfill-feed',
+                     stdout=StringIO())
+        self.assertFalse(FeedItem.objects.filter(
+            user=anna, author=vera).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_import_follows_skips_authors_over_fanout_limit(self):
+        """Автор, набравший при загрузке больше предела подписчиков, не
+        раскладывается, хотя счётчики ещё не пересчитаны."""
+        anna, boris, vera = self.users
+        Post.objects.create(text='Вера', author=vera)
+        Post.objects.create(text='Борис', author=boris)
+        path = self.write('follows.csv',
+                          'user,author\nanna,vera\nboris,vera\nanna,boris\n')
+        call_command('import_follows', path, stdout=StringIO())
+        self.assertEqual(
+            set(FeedItem.objects.values_list('user', 'author')),
+            {(anna.pk, boris.pk)})
+
+    @override_settings(FEED_FANOUT_LIMIT=1, FEED_BACKFILL_SIZE=2)
+    def test_feed_migration_respects_fanout_limit_and_backfill_size(self):
+        """Миграция ленты раскладывает только последние посты авторов в
+        пределе раскладки."""
+        anna, boris, vera = self.users
+        posts = [Post.objects.create(text=str(number), author=boris)
+                 for number in range(3)]
+        Post.objects.create(text='Вера', author=vera)
+        for user, author in ((anna, boris), (anna, vera), (boris, vera)):
+            Follow.objects.create(user=user, author=author)
+        FeedItem.objects.all().delete()
+        import_module('posts.migrations.0010_feeditem').fill_feed(apps, None)
+        self.assertEqual(
+            set(FeedItem.objects.values_list('user', 'post')),
+            {(anna.pk, posts[1].pk), (anna.pk, posts[2].pk)})
+
+    def test_export_follows_round_trip(self):
+        """export_follows пишет то, что снова читает import_follows."""
+        anna, boris, vera = self.users
+        Follow.objects.create(user=anna, author=boris)
+        Follow.objects.create(user=vera, author=anna)
+        out = StringIO()
+        call_command('export_follows', format='jsonl', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            '{"user": "anna", "author": "boris"}',
+            '{"user": "vera", "author": "anna"}',
+        ])
+        path = self.write('follows.jsonl', out.getvalue())
+        Follow.objects.all().delete()
+        call_command('import_follows', path, stdout=StringIO())
+        self.assertEqual(Follow.objects.count(), 2)
+
+
+@override_settings(FOLLOW_GRAPH_INDEX=True)
+@mock.patch('posts.graph.transaction.on_commit', lambda func: func())
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.anna, cls.boris, cls.vera = (
+            User.objects.create(username=name)
+            for name in ('anna', 'boris', 'vera'))
+        Follow.objects.create(user=cls.anna, author=cls.vera)
+        Follow.objects.create(user=cls.boris, author=cls.vera)
+
+    def setUp(self):
+        graph.reset()
+        self.addCleanup(graph.reset)
+
+    def test_graph_answers_without_queries(self):
+        """Загруженный граф отвечает на вопросы о подписках без базы."""
+        graph.warm()
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.anna.pk, self.vera.pk))
+            self.assertFalse(graph.is_following(self.vera.pk, self.anna.pk))
+            self.assertEqual(graph.followers(self.vera.pk),
+                             [self.anna.pk, self.boris.pk])
+            self.assertEqual(graph.following(self.anna.pk), [self.vera.pk])
+            self.assertEqual(graph.follower_count(self.vera.pk), 2)
+            self.assertEqual(graph.following_count(self.vera.pk), 0)
+
+    def test_graph_follows_writes(self):
+        """Подписки и отписки попадают в загруженный граф."""
+        graph.warm()
+        follows.follow(self.vera.pk, [self.anna.pk, self.boris.pk])
+        follows.unfollow(self.anna.pk, [self.vera.pk])
+        Follow.objects.create(user=self.anna, author=self.boris)
+        self.assertEqual(graph.following(self.vera.pk),
+                         [self.anna.pk, self.boris.pk])
+        self.assertEqual(graph.followers(self.vera.pk), [self.boris.pk])
+        self.assertEqual(graph.follower_count(self.boris.pk), 2)
+        self.assertFalse(graph.is_following(self.anna.pk, self.vera.pk))
+
+    def test_csr_holds_64_bit_ids(self):
+        """Массивы графа вмещают id больше 2³¹."""
+        big = 2 ** 40
+        csr = graph.CSR.from_sorted([(big, big + 1), (big, big + 2)])
+        self.assertTrue(csr.has(big, big + 2))
+        self.assertEqual(csr.neighbors(big).tolist(), [big + 1, big + 2])
+
+    def test_compaction_keeps_edges(self):
+        """Добавка, влитая в массивы, даёт тот же граф."""
+        graph.warm()
+        follows.unfollow(self.boris.pk, [self.vera.pk])
+        follows.follow(self.vera.pk, [self.anna.pk])
+        with mock.patch('posts.graph.COMPACT_THRESHOLD', 0):
+            follows.follow(self.anna.pk, [self.boris.pk])
+        current = graph.get()
+        self.assertEqual(current.followers.added, {})
+        self.assertEqual(current.following.csr.targets.tolist(),
+                         [self.boris.pk, self.vera.pk, self.anna.pk])
+        self.assertEqual(graph.followers(self.vera.pk), [self.anna.pk])
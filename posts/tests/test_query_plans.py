@@ -0,0 +1,77 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.views import POSTS_PER_PAGE
+
+# Полный проход по таблице без индекса и сортировка во временном B-дереве.
+BAD_PLAN = re.compile(r'^SCAN \S+( AS \S+)?$|TEMP B-TREE')
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент не должны читать таблицы целиком и сортировать
+    результат сами: для каждого нужен подходящий индекс."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.user = User.objects.create(username='reader')
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Заголовок', slug='test-slug', description='Текст')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for number in range(POSTS_PER_PAGE + 1):
+            post = Post.objects.create(
+                text=str(number), author=cls.author, group=cls.group)
+            Comment.objects.create(post=post, author=cls.user, text='Да')
+        cls.post = post
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def captured_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            first = self.client.get(url).context.get('page')
+            if first is not None and first.has_next():
+                # У ранжированных лент курсора по дате нет.
+                if getattr(first, 'next_cursor', None):
+                    self.client.get(f'{url}?after={first.next_cursor}')
+                self.client.get(f'{url}?page=2')
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT')]
+
+    def assertUsesIndexes(self, url):
+        with connection.cursor() as cursor:
+            for sql in self.captured_queries(url):
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    with self.subTest(sql=sql):
+                        self.assertIsNone(BAD_PLAN.search(row[-1]), row[-1])
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы всех лент идут по индексам без сортировки."""
+        urls = (
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.author.username}),
+            reverse('follow_index'),
+            reverse('trending'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertUsesIndexes(url)
+
+    def test_post_view_queries_use_indexes(self):
+        """Запросы страницы поста идут по индексам без сортировки."""
+        self.assertUsesIndexes(reverse('post', kwargs={
+            'username': self.author.username, 'post_id': self.post.id}))
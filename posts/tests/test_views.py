@@ -1,19 +1,56 @@
+import base64
 import shutil
 import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
 
-from posts.models import Post, Group, Comment, Follow
-from posts.views import POSTS_PER_PAGE
+from posts import follows, trending
+from posts.cache import ALL, VERSION_KEY
+from posts.models import (Post, Group, Comment, Follow, FeedItem,
+                          TrendingScore, UserStats)
+from posts.paginators import decode_cursor
+from posts.thumbnails import generate
+from posts.views import (COMMENTS_PER_PAGE, POSTS_PER_PAGE, index_scopes,
+                         profile_scopes)
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
 
+@contextmanager
+def shared_cache():
+    """Общий для всех процессов кэш (в файлах), как memcached или Redis."""
+    backend = 'django.core.cache.backends.filebased.FileBasedCache'
+    with tempfile.TemporaryDirectory() as directory:
+        with override_settings(CACHES={'default': {
+                'BACKEND': backend, 'LOCATION': directory}}):
+            yield
+
+
+def forget_writes(scopes, write):
+    """Выполни `write` так, будто его сделал другой процесс со своим
+    кэшем в памяти: версии лент у этого процесса остаются прежними, а
+    его кэш страниц и фрагментов успевает истечь."""
+    keys = [VERSION_KEY.format(scope) for scope in [ALL, *scopes]]
+    known = cache.get_many(keys)
+    write()
+    cache.clear()
+    cache.set_many(known, None)
+
+
 @override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class PostPagesTest(TestCase):
     @classmethod
@@ -25,6 +62,7 @@ class PostPagesTest(TestCase):
                      b'\x00\x00\x00\x2C\x00\x00\x00\x00'
                      b'\x02\x00\x01\x00\x00\x02\x02\x0C'
                      b'\x0A\x00\x3B')
+        cls.small_gif = small_gif
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=small_gif,
@@ -178,6 +216,132 @@ class PostPagesTest(TestCase):
         response3 = self.authorized_client.get(reverse('index'))
         self.assertHTMLEqual(str(response), str(response3))
 
+    def test_page_thumbnails_are_read_in_one_query(self):
+        """Все варианты миниатюр страницы читаются одним запросом."""
+        posts = [Post.objects.create(
+            text='С картинкой', author=self.user,
+            image=SimpleUploadedFile(f'small_{number}.gif', self.small_gif))
+            for number in range(3)]
+        cache.clear()
+        for post in [self.post, *posts]:
+            generate(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.guest_client.get(reverse('index'))
+        kvstore_queries = [query for query in context.captured_queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in response.context['page']:
+            if post in posts:
+                self.assertContains(response, post.thumbnail.url)
+                self.assertEqual(
+                    [content_type for content_type, _ in post.srcsets],
+                    ['image/webp', 'image/jpeg'])
+                self.assertContains(response, post.srcsets[0][1])
+                self.assertContains(response, 'data:image/jpeg;base64,')
+
+    def test_feed_fragment_cache_is_versioned(self):
+        """Фрагмент ленты живёт в кэше до записи поста или комментария."""
+        cache.clear()
+        url = reverse('group_posts', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Без сигналов')
+        new_post = Post.objects.create(
+            text='Новый пост', author=self.user, group=self.group)
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Без сигналов')
+        self.assertContains(response, new_post.text)
+
+    def test_cached_feed_fragment_reads_no_posts(self):
+        """Попадание в кэш фрагмента не читает посты и миниатюры."""
+        cache.clear()
+        for url in (reverse('index'),
+                    reverse('group_posts', kwargs={'slug': self.group.slug}),
+                    reverse('profile', kwargs={'username': self.user})):
+            with self.subTest(url=url):
+                self.authorized_client.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.authorized_client.get(url)
+                self.assertContains(response, self.post.text)
+                sql = ' '.join(q['sql'] for q in context.captured_queries)
+                self.assertNotIn('"posts_post"."text"', sql)
+                self.assertNotIn('thumbnail_kvstore', sql)
+
+    def test_feed_fragment_cache_hides_edit_button_from_others(self):
+        """Кнопка редактирования не попадает в общий фрагмент."""
+        cache.clear()
+        edit_url = reverse('post_edit', kwargs={
+            'username': self.user.username, 'post_id': self.post.id})
+        response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, edit_url)
+        other_client = Client()
+        other_client.force_login(
+            get_user_model().objects.create(username='other'))
+        response = other_client.get(reverse('index'))
+        self.assertNotContains(response, edit_url)
+
+    def test_feed_fragment_is_shared_by_all_viewers(self):
+        """Один фрагмент на всех: кнопки автора дорисовываются поверх."""
+        cache.clear()
+        edit_url = reverse('post_edit', kwargs={
+            'username': self.user.username, 'post_id': self.post.id})
+        response = self.guest_client.get(reverse('index'))
+        self.assertNotContains(response, 'Добавить комментарий')
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, edit_url)
+        self.assertNotContains(response, 'post-controls')
+        sql = ' '.join(q['sql'] for q in context.captured_queries)
+        self.assertNotIn('FROM "posts_post"', sql)
+
+    def test_anonymous_pages_are_revalidated_with_etag(self):
+        """Анонимный посетитель получает 304, пока страница не менялась."""
+        with shared_cache():
+            cache.clear()
+            url = reverse('post', kwargs={'username': self.user.username,
+                                          'post_id': self.post.id})
+            response = self.guest_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertTrue(response.has_header('Last-Modified'))
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Да')
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Да')
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_local_cache_validates_pages_by_body(self):
+        """С кэшем в памяти процесса ETag — хэш страницы, и процесс, не
+        видевший записи, не отвечает на неё 304."""
+        cache.clear()
+        url = reverse('post', kwargs={'username': self.user.username,
+                                      'post_id': self.post.id})
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        forget_writes(
+            profile_scopes(self.user.username, self.post.id),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Да'))
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Да')
+
+    def test_authorized_pages_are_not_cached_as_anonymous(self):
+        """Авторизованный пользователь не получает кэш анонимов."""
+        cache.clear()
+        self.guest_client.get(reverse('index'))
+        response = self.authorized_client.get(reverse('index'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'Все авторы')
+
     def test_authorized_user_add_comment(self):
         """Авторизированный пользователь может комментировать посты."""
         comments_count = Comment.objects.count()
@@ -267,6 +431,132 @@ class FollowPagesTest(TestCase):
         )
         self.assertIn(self.post, response.context['page'])
 
+    def test_feed_is_materialized_on_write(self):
+        """Новый пост раскладывается в ленту, отписка её очищает."""
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        new_post = Post.objects.create(text='Новый', author=self.user_author)
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user_follower, post=new_post).exists())
+        self.authorized_client_follower.get(
+            reverse('profile_unfollow', kwargs={'username': self.user_author}))
+        self.assertFalse(
+            FeedItem.objects.filter(user=self.user_follower).exists())
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        """Повторная подписка и отписка ничего не меняют и не ломают."""
+        url = reverse('profile_follow', kwargs={'username': self.user_author})
+        for _ in range(2):
+            self.authorized_client_follower.get(url)
+        self.user_author.stats.refresh_from_db()
+        self.assertEqual(self.user_author.stats.follower_count, 1)
+        self.assertEqual(FeedItem.objects.filter(
+            user=self.user_follower).count(), 1)
+        url = reverse('profile_unfollow',
+                      kwargs={'username': self.user_author})
+        for _ in range(2):
+            response = self.authorized_client_follower.get(url)
+        self.assertRedirects(response, reverse(
+            'profile', kwargs={'username': self.user_author}))
+        self.user_author.stats.refresh_from_db()
+        self.assertEqual(self.user_author.stats.follower_count, 0)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_follow(self):
+        """Подписка на список авторов одним запросом."""
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        url = reverse('bulk_follow')
+        usernames = [self.user_author.username, self.user.username,
+                     self.user_follower.username, 'нет такого']
+        response = self.authorized_client_follower.post(
+            url, {'action': 'follow', 'username': usernames})
+        self.assertEqual(response.json(), {
+            'action': 'follow',
+            'changed': [self.user.username],
+            'unknown': ['нет такого'],
+        })
+        self.assertEqual(set(Follow.objects.filter(
+            user=self.user_follower).values_list('author', flat=True)),
+            {self.user_author.pk, self.user.pk})
+        self.user_follower.stats.refresh_from_db()
+        self.assertEqual(self.user_follower.stats.following_count, 2)
+        response = self.authorized_client_follower.post(
+            url, {'action': 'unfollow', 'username': usernames})
+        self.assertEqual(sorted(response.json()['changed']),
+                         sorted([self.user_author.username,
+                                 self.user.username]))
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(
+            self.authorized_client_follower.get(url).status_code, 405)
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_feed_pulls_posts_of_popular_authors(self):
+        """Посты популярного автора читаются без раскладки по лентам."""
+        cache.clear()
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        new_post = Post.objects.create(text='Новый', author=self.user_author)
+        self.assertFalse(FeedItem.objects.exists())
+        response = self.authorized_client_follower.get(
+            reverse('follow_index'))
+        self.assertIn(new_post, response.context['page'])
+        self.assertIn(self.post, response.context['page'])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_feed_keeps_posts_when_author_stops_being_popular(self):
+        """Посты эпохи pull остаются в ленте, когда автор снова в пределе."""
+        cache.clear()
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        Follow.objects.create(user=self.user, author=self.user_author)
+        new_post = Post.objects.create(text='Новый', author=self.user_author)
+        self.assertFalse(FeedItem.objects.filter(post=new_post).exists())
+        follows.unfollow(self.user.pk, [self.user_author.pk])
+        # Отписка ничего не доливает сама: посты читаются при показе.
+        self.assertFalse(FeedItem.objects.filter(post=new_post).exists())
+        response = self.authorized_client_follower.get(
+            reverse('follow_index'))
+        self.assertIn(new_post, response.context['page'])
+        self.assertIn(self.post, response.context['page'])
+
+        call_command('backfill_feeds', stdout=StringIO())
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user_follower, post=new_post).exists())
+        self.user_author.stats.refresh_from_db()
+        self.assertIsNone(self.user_author.stats.feed_backfill_requested)
+        response = self.authorized_client_follower.get(
+            reverse('follow_index'))
+        self.assertIn(new_post, response.context['page'])
+        self.assertIn(self.post, response.context['page'])
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_backfill_feeds_walks_followers_in_batches(self):
+        """`backfill_feeds` проходит всех подписчиков пачками."""
+        cache.clear()
+        reader = get_user_model().objects.create(username='reader')
+        for user in (self.user_follower, self.user, reader):
+            Follow.objects.create(user=user, author=self.user_author)
+        follows.unfollow(reader.pk, [self.user_author.pk])
+        FeedItem.objects.all().delete()
+        call_command('backfill_feeds', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            set(FeedItem.objects.values_list('user', 'post')),
+            {(self.user_follower.pk, self.post.pk),
+             (self.user.pk, self.post.pk)})
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_backfill_feeds_keeps_newer_request(self):
+        """Отметку, поставленную заново во время работы, команда не
+        снимает."""
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        Follow.objects.create(user=self.user, author=self.user_author)
+        follows.unfollow(self.user.pk, [self.user_author.pk])
+        stats = UserStats.objects.filter(user=self.user_author)
+
+        def request_again(edges):
+            stats.update(feed_backfill_requested=timezone.now())
+
+        with mock.patch('posts.feed.backfill_edges', request_again):
+            call_command('backfill_feeds', stdout=StringIO())
+        self.assertIsNotNone(stats.get().feed_backfill_requested)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -276,6 +566,9 @@ class PaginatorViewsTest(TestCase):
         cls.user = User.objects.create(username='Test_user')
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.user)
+        cls.follower = User.objects.create(username='Follower')
+        cls.follower_client = Client()
+        cls.follower_client.force_login(cls.follower)
 
         cls.group = Group.objects.create(
             title='Заголовок',
@@ -288,6 +581,7 @@ class PaginatorViewsTest(TestCase):
             author=cls.user,
             group=cls.group,
         ) for post in range(cls.post_count)])
+        call_command('recount_counters', stdout=StringIO())
 
     def test_first_page_containse_ten_records(self):
         """Проверка: количество постов на первой странице равно 10."""
@@ -300,3 +594,427 @@ class PaginatorViewsTest(TestCase):
         response = self.authorized_client.get(reverse('index') + '?page=2')
         self.assertEqual(len(response.context.get('page').object_list),
                             (self.post_count - POSTS_PER_PAGE))
+
+    def test_feed_pages_do_not_count_posts(self):
+        """Проверка: ленты не выполняют SELECT COUNT(*) на каждый запрос."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        urls = (
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+            reverse('follow_index'),
+        )
+        self.authorized_client.get(reverse('index'))
+        for url in urls:
+            with self.subTest(url=url):
+                client = self.follower_client if 'follow' in url else (
+                    self.authorized_client)
+                with CaptureQueriesContext(connection) as context:
+                    response = client.get(url + '?page=2')
+                self.assertEqual(len(response.context['page']),
+                                 self.post_count - POSTS_PER_PAGE)
+                sql = ' '.join(q['sql'] for q in context.captured_queries)
+                self.assertNotIn('COUNT(', sql)
+
+    def test_page_past_the_end_shows_last_page(self):
+        """Проверка: номер за концом ленты открывает последнюю страницу
+        и не выдумывает записей, которых нет."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        url = reverse('follow_index')
+        for number in ('3', '50', '9' * 30):
+            with self.subTest(page=number):
+                response = self.follower_client.get(f'{url}?page={number}')
+                page = response.context['page']
+                self.assertEqual(page.number, 2)
+                self.assertEqual(page.paginator.count, self.post_count)
+                self.assertEqual(len(page), self.post_count - POSTS_PER_PAGE)
+
+    def test_cursor_pages_cover_all_records(self):
+        """Проверка: курсорные страницы идут подряд без повторов."""
+        first = self.authorized_client.get(reverse('index')).context['page']
+        response = self.authorized_client.get(
+            reverse('index') + f'?after={first.next_cursor}')
+        second = response.context['page']
+        self.assertEqual(len(second), self.post_count - POSTS_PER_PAGE)
+        self.assertFalse(second.has_next())
+        ids = [post.id for post in first] + [post.id for post in second]
+        self.assertEqual(len(set(ids)), self.post_count)
+
+        response = self.authorized_client.get(
+            reverse('index') + f'?before={second.previous_cursor}')
+        self.assertEqual([post.id for post in response.context['page']],
+                         [post.id for post in first])
+
+    def test_broken_cursor_opens_first_page(self):
+        """Проверка: токен с огромным id или датой без пояса — первая
+        страница, а не ошибка."""
+        tokens = [
+            encode_raw(f'2020-01-01T00:00:00+00:00|{"9" * 30}'),
+            encode_raw('2020-01-01T00:00:00|1'),
+        ]
+        for token in tokens:
+            self.assertIsNone(decode_cursor(token))
+            for url in (reverse('index'), reverse('api_index')):
+                with self.subTest(token=token, url=url):
+                    response = self.authorized_client.get(
+                        url, {'after': token})
+                    self.assertEqual(response.status_code, 200)
+
+    def test_cursor_pagination_in_group_and_profile(self):
+        """Проверка: курсор работает на страницах группы и профайла."""
+        urls = (
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.authorized_client.get(url).context['page']
+                response = self.authorized_client.get(
+                    url + f'?after={first.next_cursor}')
+                self.assertEqual(len(response.context['page']),
+                                 self.post_count - POSTS_PER_PAGE)
+
+
+def encode_raw(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.user = User.objects.create(username='Читатель')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Текст',
+            slug='test-slug',
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_posts(self, count):
+        User = get_user_model()
+        for number in range(User.objects.count(),
+                            User.objects.count() + count):
+            author = User.objects.create(username=f'author_{number}')
+            Follow.objects.create(user=self.user, author=author)
+            post = Post.objects.create(
+                text=str(number), author=author, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text='Да')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(url)
+        return len(context.captured_queries)
+
+    def test_feed_queries_do_not_depend_on_posts_count(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        urls = (
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('follow_index'),
+        )
+        self.create_posts(1)
+        single = {url: self.count_queries(url) for url in urls}
+        self.create_posts(POSTS_PER_PAGE)
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertEqual(self.count_queries(url), single[url])
+
+    def test_post_page_queries_do_not_depend_on_comments(self):
+        """Число запросов страницы поста не растёт с числом комментариев,
+        а комментарии листаются курсором до конца."""
+        User = get_user_model()
+        post = Post.objects.create(text='Пост', author=self.user)
+        url = reverse('post', kwargs={'username': self.user.username,
+                                      'post_id': post.id})
+        Comment.objects.create(post=post, author=self.user, text='0')
+        single = self.count_queries(url)
+        Comment.objects.bulk_create(
+            Comment(post=post, text=str(number), author=User.objects.create(
+                username=f'commenter_{number}'))
+            for number in range(1, COMMENTS_PER_PAGE * 2 + 5))
+        cache.clear()
+        # Плюс проверка, есть ли комментарии после полной страницы.
+        self.assertEqual(self.count_queries(url), single + 1)
+        seen = []
+        response = self.authorized_client.get(url)
+        while True:
+            seen.extend(
+                comment.text for comment in response.context['comments'])
+            cursor = response.context['comments_next']
+            if cursor is None:
+                break
+            response = self.authorized_client.get(
+                url, {'comments_after': cursor})
+        self.assertEqual(
+            sorted(seen, key=int),
+            [str(number) for number in range(COMMENTS_PER_PAGE * 2 + 5)])
+
+    def test_feed_shows_comment_count(self):
+        """Карточка поста показывает число комментариев."""
+        self.create_posts(1)
+        response = self.authorized_client.get(reverse('index'))
+        self.assertEqual(response.context['page'][0].comment_count, 1)
+        self.assertContains(response, 'Комментариев: 1')
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.user = User.objects.create(username='Писатель')
+        cls.rare = Post.objects.create(
+            text='Ёжик в тумане и лошадка', author=cls.user)
+        cls.frequent = Post.objects.create(
+            text='Ёжик, ёжик, ёжик и ещё раз ежик', author=cls.user)
+        Post.objects.create(text='Совсем про другое', author=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('search'), {'q': query, **params})
+        return list(response.context['page'])
+
+    def test_search_ranks_matches_by_relevance(self):
+        """Находятся только подходящие посты, самые релевантные первыми."""
+        self.assertEqual(self.search('ёжик'), [self.frequent, self.rare])
+        self.assertEqual(self.search('ЛОШАД'), [self.rare])
+
+    def test_search_ignores_fts_syntax(self):
+        """Операторы и кавычки в запросе не ломают поиск."""
+        self.assertEqual(self.search('"ёжик* (-'),
+                         [self.frequent, self.rare])
+        self.assertEqual(self.search('  '), [])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(text='бегемот', author=self.user)
+        self.assertEqual(self.search('бегемот'), [post])
+        Post.objects.filter(pk=post.pk).update(text='носорог')
+        self.assertEqual(self.search('бегемот'), [])
+        self.assertEqual(self.search('носорог'), [post])
+        post.delete()
+        self.assertEqual(self.search('носорог'), [])
+
+    def test_search_pages_keep_query(self):
+        """Ссылки на страницы выдачи сохраняют поисковый запрос."""
+        Post.objects.bulk_create(
+            Post(text=f'ёжик {number}', author=self.user)
+            for number in range(POSTS_PER_PAGE))
+        response = self.client.get(reverse('search'), {'q': 'ёжик'})
+        self.assertContains(response, 'href="?q=%D1%91%D0%B6%D0%B8%D0%BA'
+                                      '&amp;page=2"')
+        self.assertEqual(len(self.search('ёжик', page=2)), 2)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'лошадка'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.rare])
+        self.assertTrue(any('posts_post_fts MATCH' in query['sql']
+                            for query in context.captured_queries))
+
+
+class RecommendationViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.anna, cls.boris, cls.vera, cls.gleb, cls.dina = (
+            User.objects.create(username=name)
+            for name in ('anna', 'boris', 'vera', 'gleb', 'dina'))
+        group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.anna, author=cls.boris)
+        Follow.objects.create(user=cls.boris, author=cls.vera)
+        Follow.objects.create(user=cls.boris, author=cls.gleb)
+        Follow.objects.create(user=cls.gleb, author=cls.vera)
+        Post.objects.create(text='Текст', author=cls.anna, group=group)
+        Post.objects.create(text='Текст', author=cls.dina, group=group)
+
+    def setUp(self):
+        self.client.force_login(self.anna)
+        call_command('recommend_follows', stdout=StringIO())
+
+    def recommendations(self, url):
+        return self.client.get(url).context['recommendations']
+
+    def test_recommend_friends_of_friends_then_groups(self):
+        """Друзья друзей идут раньше соседей по группе."""
+        self.assertEqual(self.recommendations(reverse('follow_index')),
+                         [self.vera, self.gleb, self.dina])
+        self.assertEqual(
+            self.recommendations(reverse('profile', args=['dina'])),
+            [self.vera, self.gleb, self.dina])
+
+    def test_followed_authors_are_not_recommended(self):
+        """Авторы из подписок пропадают из рекомендаций сразу."""
+        Follow.objects.create(user=self.anna, author=self.vera)
+        self.assertEqual(self.recommendations(reverse('follow_index')),
+                         [self.gleb, self.dina])
+        call_command('recommend_follows', stdout=StringIO())
+        self.assertEqual(self.recommendations(reverse('follow_index')),
+                         [self.gleb, self.dina])
+
+
+class TrendingViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = get_user_model().objects.create(username='trend')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def trending(self):
+        return list(self.client.get(reverse('trending')).context['page'])
+
+    def test_comment_moves_post_up(self):
+        """Комментарий поднимает пост выше более нового поста."""
+        old = Post.objects.create(text='Старый', author=self.user)
+        new = Post.objects.create(text='Новый', author=self.user)
+        self.assertEqual(self.trending(), [new, old])
+        self.client.post(
+            reverse('add_comment', args=[self.user.username, old.pk]),
+            {'text': 'Комментарий'})
+        self.assertEqual(self.trending(), [old, new])
+
+    def test_activity_decays_by_half_life(self):
+        """Два события период полураспада назад весят как одно сейчас."""
+        now = timezone.now()
+        half_life = timedelta(seconds=trending.half_life())
+        post = Post.objects.create(text='Текст', author=self.user)
+        TrendingScore.objects.all().delete()
+        trending.add_activity(post.pk, now - half_life)
+        trending.add_activity(post.pk, now - half_life)
+        post.trending.refresh_from_db()
+        self.assertAlmostEqual(post.trending.score, trending.log_weight(now))
+
+    def test_update_trending_prunes_and_rebuilds(self):
+        """Команда удаляет затухшие строки и умеет пересчитать таблицу."""
+        fresh = Post.objects.create(text='Свежий', author=self.user)
+        stale = Post.objects.create(text='Старый', author=self.user)
+        Post.objects.filter(pk=stale.pk).update(
+            pub_date=timezone.now() - timedelta(days=30))
+        TrendingScore.objects.filter(post=stale).update(
+            score=trending.log_weight(timezone.now() - timedelta(days=30)))
+        Comment.objects.create(post=fresh, author=self.user, text='Да')
+        score = TrendingScore.objects.get(post=fresh).score
+        call_command('update_trending', stdout=StringIO())
+        self.assertEqual(self.trending(), [fresh])
+        TrendingScore.objects.all().delete()
+        call_command('update_trending', rebuild=True, stdout=StringIO())
+        self.assertEqual(self.trending(), [fresh])
+        self.assertAlmostEqual(
+            TrendingScore.objects.get(post=fresh).score, score)
+
+
+class ApiViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.author = User.objects.create(username='api_author')
+        cls.reader = User.objects.create(username='api_reader')
+        cls.group = Group.objects.create(title='API', slug='api')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.author,
+                                group=cls.group)
+            for number in range(POSTS_PER_PAGE + 3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        """Пройди ленту курсором до конца; верни id постов."""
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [post['id'] for post in data['results']]
+            url = data['next']
+        return ids
+
+    def test_api_feeds_page_through_same_posts(self):
+        """JSON-ленты листаются курсором и отдают те же посты."""
+        expected = [post.pk for post in reversed(self.posts)]
+        self.client.force_login(self.reader)
+        for url in (reverse('api_index'),
+                    reverse('api_group_posts', args=[self.group.slug]),
+                    reverse('api_profile', args=[self.author.username]),
+                    reverse('api_follow_index')):
+            with self.subTest(url=url):
+                self.assertEqual(self.walk(f'{url}?fields=id'), expected)
+
+    def test_api_routes_leave_username_api_alone(self):
+        """На пользователя «api» можно подписаться и открыть его профиль."""
+        api_user = get_user_model().objects.create(username='api')
+        self.client.force_login(self.reader)
+        self.client.get(reverse('profile_follow', args=['api']))
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=api_user).exists())
+        response = self.client.get(reverse('profile', args=['api']))
+        self.assertEqual(response.context['author'], api_user)
+
+    def test_fields_limit_response_and_columns(self):
+        """`fields=` ограничивает и ответ, и выбираемые столбцы."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('api_index'),
+                                       {'fields': 'id,author'})
+        self.assertEqual(response.json()['results'][0],
+                         {'id': self.posts[-1].pk, 'author': 'api_author'})
+        sql = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('"posts_post"."text"', sql)
+        self.assertNotIn('posts_group', sql)
+        response = self.client.get(reverse('api_index'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_answers_not_modified_until_feed_changes(self):
+        """Совпавший ETag даёт 304 без запросов, новый пост — новый ETag."""
+        with shared_cache():
+            url = reverse('api_index')
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            Post.objects.create(text='Новый', author=self.author)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_local_cache_etag_hashes_body(self):
+        """С кэшем в памяти процесса ETag — хэш ответа, а не версии."""
+        url = reverse('api_index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        forget_writes(index_scopes(), lambda: Post.objects.create(
+            text='Новый', author=self.author))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый')
+
+    def test_follow_feed_needs_login_and_hashes_body(self):
+        """Лента подписок требует входа, её ETag — хэш ответа."""
+        url = reverse('api_follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
@@ -0,0 +1,190 @@
+"""Миниатюры картинок постов: заготовка заранее и пакетное чтение.
+
+Шаблон `blok_post.html` строит миниатюру тегом `{% thumbnail %}` при
+первом показе. Чтобы первый зритель не ждал Pillow, после сохранения
+поста те же миниатюры создаются в фоновом потоке, а для уже
+загруженных картинок — командой `generate_thumbnails`.
+
+Для карточки поста заготавливается набор ширин в WebP и JPEG (для
+`srcset`) и крошечная размытая заглушка, которая сохраняется в
+`Post.image_placeholder` и встраивается в страницу как data URI.
+
+Тег `{% thumbnail %}` ищет каждую миниатюру в key-value хранилище sorl
+отдельным запросом. `attach_thumbnails` находит все варианты миниатюр
+страницы одним `get_many` к кэшу (и одним запросом к базе для
+промахов), а шаблон берёт готовые `post.thumbnail` и `post.srcsets`.
+"""
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from . import cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+CARD_RATIO = 339 / 960
+CARD_WIDTHS = (480, 960, 1440)
+# Форматы в порядке предпочтения браузером: (формат Pillow, content type).
+CARD_FORMATS = (('WEBP', 'image/webp'), ('JPEG', 'image/jpeg'))
+# Миниатюра для `src`. Те же размеры и параметры, что в `{% thumbnail %}`
+# шаблона `includes/blok_post.html`: иначе заготовка не совпадёт по ключу.
+CARD_FALLBACK = ('JPEG', 960)
+PLACEHOLDER = ('24x8', {**CARD_OPTIONS, 'format': 'JPEG', 'quality': 30})
+
+
+def card_geometry(width):
+    return f'{width}x{round(width * CARD_RATIO)}'
+
+
+# {(формат, ширина): (геометрия, параметры sorl)}
+CARD_VARIANTS = {
+    (image_format, width): (
+        card_geometry(width), {**CARD_OPTIONS, 'format': image_format})
+    for image_format, _ in CARD_FORMATS for width in CARD_WIDTHS
+}
+POST_THUMBNAILS = tuple(CARD_VARIANTS.values())
+
+_executor = None
+
+
+def workers():
+    return getattr(settings, 'THUMBNAIL_BACKGROUND_WORKERS', 2)
+
+
+def source_file(name):
+    """Картинка поста в хранилище поля `Post.image`.
+
+    Ключи sorl зависят от класса хранилища исходника, поэтому и здесь,
+    и в шаблоне картинка должна открываться через одно хранилище.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Создай недостающие миниатюры и заглушку картинки `name`."""
+    try:
+        source = source_file(name)
+        for geometry, options in POST_THUMBNAILS:
+            get_thumbnail(source, geometry, **options)
+        geometry, options = PLACEHOLDER
+        content = get_thumbnail(source, geometry, **options).read()
+        placeholder = ('data:image/jpeg;base64,'
+                       + base64.b64encode(content).decode())
+        posts = list(Post.objects.filter(image=name).exclude(
+            image_placeholder=placeholder,
+        ).only('pk', 'author', 'group'))
+        if posts:
+            Post.objects.filter(pk__in=[post.pk for post in posts]).update(
+                image_placeholder=placeholder)
+            # Ленты и ETag, собранные без миниатюр, должны обновиться.
+            cache.bump(*{scope for post in posts
+                         for scope in cache.post_scopes(post)})
+    finally:
+        close_old_connections()
+
+
+def _generate_logged(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+def schedule(name):
+    """Создай миниатюры после коммита транзакции, вне обработки запроса.
+
+    При `THUMBNAIL_BACKGROUND_WORKERS = 0` миниатюры создаются сразу.
+    """
+    global _executor
+    if not name:
+        return
+    if not workers():
+        transaction.on_commit(lambda: _generate_logged(name))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=workers(), thread_name_prefix='thumbnails')
+    transaction.on_commit(lambda: _executor.submit(_generate_logged, name))
+
+
+def thumbnail_file(name, geometry, options):
+    """Миниатюра, которую для этой картинки вернул бы `get_thumbnail`.
+
+    Повторяет подстановку параметров по умолчанию из
+    `ThumbnailBackend.get_thumbnail`, чтобы получить то же имя файла и
+    тот же ключ в хранилище, но ничего не читает и не создаёт.
+    """
+    backend = default.backend
+    source = source_file(name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage)
+
+
+def bulk_get(names, variants):
+    """Словарь {(имя картинки, вариант): готовая миниатюра}.
+
+    `variants` — словарь {вариант: (геометрия, параметры)}. Ещё не
+    созданных миниатюр в словаре нет.
+    """
+    keys = {
+        add_prefix(thumbnail_file(name, geometry, options).key):
+            (name, variant)
+        for name in names
+        for variant, (geometry, options) in variants.items()
+    }
+    if not keys:
+        return {}
+    kv_cache = default.kvstore.cache
+    raw = {key: value for key, value in kv_cache.get_many(keys).items()
+           if isinstance(value, str)}
+    missing = [key for key in keys if key not in raw]
+    if missing:
+        found = dict(KVStore.objects.filter(key__in=missing).values_list(
+            'key', 'value'))
+        kv_cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        raw.update(found)
+    return {keys[key]: deserialize_image_file(value)
+            for key, value in raw.items()}
+
+
+def attach_thumbnails(posts):
+    """Проставь постам страницы `thumbnail` и `srcsets` разом.
+
+    `srcsets` — список пар (content type, srcset) для `<source>`.
+    """
+    posts = [post for post in posts if post.image]
+    thumbnails = bulk_get({post.image.name for post in posts},
+                          CARD_VARIANTS)
+    for post in posts:
+        name = post.image.name
+        post.thumbnail = thumbnails.get((name, CARD_FALLBACK))
+        post.srcsets = []
+        for image_format, content_type in CARD_FORMATS:
+            candidates = []
+            for width in CARD_WIDTHS:
+                thumbnail = thumbnails.get((name, (image_format, width)))
+                if thumbnail is not None:
+                    candidates.append(f'{thumbnail.url} {width}w')
+            if candidates:
+                post.srcsets.append((content_type, ', '.join(candidates)))
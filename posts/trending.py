@@ -0,0 +1,99 @@
+"""Страница «Популярное»: посты с самой живой недавней активностью.
+
+Каждое событие (публикация поста, комментарий) весит `weight`, и его
+вклад со временем уменьшается вдвое за `TRENDING_HALF_LIFE` секунд.
+Затухание общее для всех постов, поэтому вклад можно считать от
+неподвижной эпохи: 2 ** ((t − EPOCH) / half_life). Чтобы такие числа
+не переполнялись, хранится их логарифм, а сложение делается как
+log(e^a + e^b) = max(a, b) + ln(1 + e^−|a − b|) прямо в UPSERT —
+одна строка, один запрос на событие, без пересчёта по комментариям.
+
+Старые строки ничего не портят, но раздувают таблицу, поэтому
+`update_trending` периодически удаляет посты, вся активность которых
+затухла сильнее, чем один комментарий `max_age` назад.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Comment, Post, TrendingScore
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+POST_WEIGHT = 1.0
+COMMENT_WEIGHT = 1.0
+TABLE = TrendingScore._meta.db_table
+UPSERT = (
+    f'INSERT INTO {TABLE} (post_id, score) VALUES (%s, %s) '
+    f'ON CONFLICT (post_id) DO UPDATE SET score = '
+    f'MAX(score, excluded.score) '
+    f'+ LN(1 + EXP(-ABS(score - excluded.score)))')
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 60 * 60 * 6)
+
+
+def log_weight(when, weight=1.0):
+    """Логарифм вклада события с весом `weight` в момент `when`."""
+    elapsed = (when - EPOCH).total_seconds() / half_life()
+    return math.log(weight) + elapsed * math.log(2)
+
+
+def add_activity(post_id, when, weight=1.0):
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT, [post_id, log_weight(when, weight)])
+
+
+def post_added(post):
+    add_activity(post.pk, post.pub_date, POST_WEIGHT)
+
+
+def comment_added(comment):
+    add_activity(comment.post_id, comment.created, COMMENT_WEIGHT)
+
+
+def trending_posts():
+    """Посты по убыванию активности: один проход по индексу score."""
+    return Post.objects.for_feed().filter(
+        trending__isnull=False).order_by('-trending__score')
+
+
+def prune(now, max_age):
+    """Удали строки постов, затухших сильнее события `max_age` назад."""
+    deleted, _ = TrendingScore.objects.filter(
+        score__lt=log_weight(now - max_age, COMMENT_WEIGHT)).delete()
+    return deleted
+
+
+def logaddexp(a, b):
+    if a is None:
+        return b
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def rebuild(now, max_age):
+    """Пересчитай таблицу заново по постам и комментариям за `max_age`.
+
+    Нужен один раз — для активности, случившейся до появления таблицы,
+    или после смены `TRENDING_HALF_LIFE`.
+    """
+    since = now - max_age
+    scores = {}
+    events = (
+        (Post.objects.filter(pub_date__gte=since).values_list(
+            'pk', 'pub_date'), POST_WEIGHT),
+        (Comment.objects.filter(created__gte=since).values_list(
+            'post', 'created'), COMMENT_WEIGHT),
+    )
+    for rows, weight in events:
+        for post_id, when in rows.order_by().iterator():
+            scores[post_id] = logaddexp(
+                scores.get(post_id), log_weight(when, weight))
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(
+            TrendingScore(post_id=post_id, score=score)
+            for post_id, score in scores.items())
+    return len(scores)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -9,6 +9,18 @@ urlpatterns = [
     path('500/', views.server_error, name='500'),
     path('404/', views.page_not_found, name='404'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/bulk/', views.bulk_follow, name='bulk_follow'),
+    path('search/', views.search, name='search'),
+    path('trending/', views.trending, name='trending'),
+    # Адреса API начинаются с двух сегментов, так что ни один не совпадёт
+    # с `<username>/follow/` и другими адресами профиля (например, у
+    # пользователя по имени «api»).
+    path('api/v1/posts/', api.index, name='api_index'),
+    path('api/v1/group/<slug:slug>/', api.group_posts,
+         name='api_group_posts'),
+    path('api/v1/follow/', api.follow_index, name='api_follow_index'),
+    path('api/v1/profile/<str:username>/', api.profile,
+         name='api_profile'),
     path('<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
     path('<str:username>/unfollow/',
@@ -1,38 +1,95 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+
+from yatube.db_router import read_from_replica
 
+from . import graph
+from .cache import (anonymous_page_cache, author_scope, feed_cache_key,
+                    feed_cache_timeout, group_scope, post_scope)
+from .counters import post_moved
+from .feed import feed_for
+from .follows import follow, unfollow
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Follow
+from .models import Post, Group
+from .paginators import (LookaheadQuerySet, cached_count, cursor_slice,
+                         page_number, paginate)
+from .recommendations import for_user as recommended_authors
+from .search import search_posts
+from .thumbnails import attach_thumbnails
+from .thumbnails import schedule as schedule_thumbnails
+from .trending import trending_posts
 
 User = get_user_model()
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+COMMENTS_AFTER = 'comments_after'
+BULK_FOLLOW_LIMIT = 200
+RECOMMENDATIONS_SHOWN = 5
+
+
+def index_scopes():
+    return ['index']
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return [group_scope(group_id)]
 
 
+def profile_scopes(username, post_id=None):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    if post_id is None:
+        return [author_scope(author_id)]
+    return [author_scope(author_id), post_scope(post_id)]
+
+
+@read_from_replica
+@anonymous_page_cache(index_scopes)
 def index(request):
     """Главная страница."""
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    contex = {'page': page, 'paginator': paginator}
+    post_list = Post.objects.for_feed()
+    page, paginator = paginate(request, post_list, POSTS_PER_PAGE,
+                               count=cached_count(Post.objects, 'index'))
+    contex = {'page': page, 'paginator': paginator,
+              'feed_cache_key': feed_cache_key(
+                  request, 'index',
+                  prepare=partial(attach_thumbnails, page)),
+              'feed_cache_timeout': feed_cache_timeout()}
     return render(request, 'index.html', contex)
 
 
+@read_from_replica
+@anonymous_page_cache(group_scopes)
 def group_posts(request, slug):
     """Страница группы."""
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = group.posts.for_feed()
+    page, paginator = paginate(request, post_list, POSTS_PER_PAGE,
+                               count=group.post_count)
     contex = {'group': group,
-              'page': page, 'paginator': paginator}
+              'page': page, 'paginator': paginator,
+              'feed_cache_key': feed_cache_key(
+                  request, group_scope(group.pk),
+                  prepare=partial(attach_thumbnails, page)),
+              'feed_cache_timeout': feed_cache_timeout()}
     return render(request, 'group.html', contex)
 
 
 @login_required
+@transaction.atomic
 def new_post(request):
     """Страница профайла автора."""
     form = PostForm(request.POST or None, files=request.FILES or None,)
@@ -40,38 +97,64 @@ def new_post(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        schedule_thumbnails(new_post.image.name)
         return redirect('index')
     contex = {'form': form, 'is_edit': False}
     return render(request, 'new.html', contex)
 
 
+def author_post_count(author):
+    """Число постов автора из счётчика, если он уже заведён."""
+    stats = getattr(author, 'stats', None)
+    return stats.post_count if stats else None
+
+
+@read_from_replica
+@anonymous_page_cache(profile_scopes)
 def profile(request, username):
     """Страница профайла автора."""
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    is_following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    post_list = author.posts.for_feed()
+    page, paginator = paginate(request, post_list, POSTS_PER_PAGE,
+                               count=author_post_count(author))
+    is_following = (request.user.is_authenticated
+                    and graph.is_following(request.user.pk, author.pk))
+    recommendations = []
+    if request.user.is_authenticated:
+        recommendations = recommended_authors(
+            request.user, RECOMMENDATIONS_SHOWN)
     contex = {'author': author, 'page': page, 'paginator': paginator,
-              'is_following': is_following}
+              'is_following': is_following,
+              'recommendations': recommendations,
+              'feed_cache_key': feed_cache_key(
+                  request, author_scope(author.pk),
+                  prepare=partial(attach_thumbnails, page)),
+              'feed_cache_timeout': feed_cache_timeout()}
     return render(request, 'profile.html', contex)
 
 
+@read_from_replica
+@anonymous_page_cache(profile_scopes)
 def post_view(request, username, post_id):
     """Страница с отдельным постом."""
-    post = get_object_or_404(Post, author__username=username,
-                             id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related('author__stats'),
+        author__username=username, id=post_id)
+    attach_thumbnails([post])
+    comments, comments_next = cursor_slice(
+        post.comments.select_related('author'), COMMENTS_PER_PAGE,
+        after=request.GET.get(COMMENTS_AFTER), keys=('created', 'pk'))
     form = CommentForm()
     contex = {'post': post, 'author': post.author,
-              'comments': comments, 'form': form}
+              'comments': comments, 'comments_next': comments_next,
+              'comments_paged': COMMENTS_AFTER in request.GET,
+              'form': form}
     return render(request, 'post.html', contex)
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
     """Страница с отдельным постом и с формой для комментария."""
     post = get_object_or_404(Post, author__username=username,
@@ -93,11 +176,20 @@ def post_edit(request, username, post_id):
         return redirect('post', username, post_id)
     else:
         post = get_object_or_404(Post, author__username=username, id=post_id)
+        old_group_id = post.group_id
+        old_image = post.image.name
         form = PostForm(request.POST or None,
                         files=request.FILES or None,
                         instance=post)
         if form.is_valid():
-            form.save()
+            if 'image' in form.changed_data:
+                post.image_placeholder = ''
+            with transaction.atomic():
+                form.save()
+                post_moved(post, old_group_id)
+                if 'image' in form.changed_data:
+                    post.image.storage.release(old_image)
+                    schedule_thumbnails(post.image.name)
             return redirect('post', username, post_id)
         return render(request, 'new.html', {
             'form': form,
@@ -105,33 +197,89 @@ def post_edit(request, username, post_id):
             'is_edit': True, })
 
 
+@read_from_replica
 @login_required
 def follow_index(request):
     """Страница с постами авторов на которых подписан пользователь."""
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    context = {'page': page, 'paginator': paginator}
+    post_list, keys = feed_for(request.user)
+    page, paginator = paginate(request, post_list, POSTS_PER_PAGE, keys)
+    attach_thumbnails(page)
+    context = {'page': page, 'paginator': paginator,
+               'recommendations': recommended_authors(
+                   request.user, RECOMMENDATIONS_SHOWN)}
     return render(request, 'follow.html', context)
 
 
+@read_from_replica
+def search(request):
+    """Поиск постов по тексту, самые релевантные — первыми."""
+    query = request.GET.get('q', '').strip()
+    # Ранжированную выдачу не листают курсором по дате, а считать все
+    # совпадения ради номеров страниц дорого: читаем страницу с запасом.
+    object_list = LookaheadQuerySet(
+        search_posts(query), POSTS_PER_PAGE, page_number(request))
+    paginator = Paginator(object_list, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    attach_thumbnails(page)
+    context = {'query': query, 'page': page, 'paginator': paginator}
+    return render(request, 'search.html', context)
+
+
+@read_from_replica
+def trending(request):
+    """Посты с самой живой активностью за последнее время."""
+    object_list = LookaheadQuerySet(
+        trending_posts(), POSTS_PER_PAGE, page_number(request))
+    paginator = Paginator(object_list, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    attach_thumbnails(page)
+    context = {'page': page, 'paginator': paginator}
+    return render(request, 'trending.html', context)
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user and not Follow.objects.filter(
-            user=request.user, author=author).exists():
-        Follow.objects.get_or_create(user=request.user, author=author)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    follow(request.user.pk, [author.pk])
     return redirect('profile', username=username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
-    get_object_or_404(
-        Follow, user=request.user, author__username=username).delete()
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    unfollow(request.user.pk, [author.pk])
     return redirect('profile', username=username)
 
 
+@login_required
+@require_POST
+@transaction.atomic
+def bulk_follow(request):
+    """Подпиши на список авторов (или отпиши от него) одним запросом.
+
+    Ждёт POST с полями `username` (повторяется) и `action` — `follow`
+    или `unfollow`; отвечает JSON со списком изменённых подписок.
+    """
+    action = request.POST.get('action', 'follow')
+    usernames = request.POST.getlist('username')
+    if action not in ('follow', 'unfollow'):
+        return HttpResponseBadRequest('action: follow или unfollow')
+    if len(usernames) > BULK_FOLLOW_LIMIT:
+        return HttpResponseBadRequest(
+            f'Не больше {BULK_FOLLOW_LIMIT} авторов за раз')
+    authors = dict(User.objects.filter(username__in=usernames).values_list(
+        'pk', 'username'))
+    change = follow if action == 'follow' else unfollow
+    changed = change(request.user.pk, list(authors))
+    return JsonResponse({
+        'action': action,
+        'changed': [authors[pk] for pk in changed],
+        'unknown': sorted(set(usernames) - set(authors.values())),
+    })
+
+
 def page_not_found(request, exception=None):
     return render(
         request,
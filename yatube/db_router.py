@@ -0,0 +1,94 @@
+"""Чтение лент с реплик базы и запись в основную базу.
+
+На реплики уходят только запросы view, обёрнутых в `read_from_replica`,
+и только к моделям приложения `posts`. Пользователи, сессии и типы
+содержимого всегда читаются из `default`: сессия, созданная после
+последней синхронизации реплики, иначе не нашлась бы. Записи тоже идут
+в `default`. После записи
+пользователь «прилипает» к основной базе: до конца запроса и ещё на
+`REPLICA_PIN_SECONDS` секунд через cookie, чтобы после редиректа он
+увидел свою запись, даже если реплика ещё не догнала основную базу.
+
+Реплика отстаёт от основной базы на интервал `sync_replicas`, а версии
+лент в кэше поднимаются сразу при записи. Поэтому то, что прочитано с
+реплики (`used_replica()`), кэш не хранит под текущей версией дольше
+`REPLICA_SYNC_INTERVAL`.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'pin_primary'
+# Приложения, модели которых можно читать с реплик.
+REPLICA_APPS = {'posts'}
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def used_replica():
+    """Читал ли текущий запрос что-нибудь с реплики."""
+    return getattr(_state, 'used_replica', False)
+
+
+def read_from_replica(view):
+    """Разреши view читать данные с реплик."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _state.replica_allowed = True
+        _state.used_replica = False
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica_allowed = False
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (model._meta.app_label not in REPLICA_APPS or not replicas()
+                or getattr(_state, 'pinned', False)
+                or not getattr(_state, 'replica_allowed', False)):
+            return PRIMARY
+        _state.used_replica = True
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaPinMiddleware:
+    """Сбрасывает состояние роутера на каждом запросе и ставит cookie
+    `pin_primary` после запроса, который что-то записал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.pinned = PIN_COOKIE in request.COOKIES
+        _state.wrote = _state.used_replica = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.pinned = _state.wrote = _state.used_replica = False
+        if wrote and replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True)
+        return response
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.db_router.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,13 +85,50 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Рабочий профиль SQLite: журнал WAL (чтение не ждёт записи), ожидание
+# блокировки вместо ошибки «database is locked» и соединения, которые
+# переживают запрос. PRAGMA выполняются на каждом новом соединении.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'PRAGMAS': SQLITE_PRAGMAS,
     }
 }
 
+# Реплики только для чтения лент: пути к копиям базы через запятую.
+# Копии обновляет команда `sync_replicas`.
+REPLICA_PATHS = [
+    path for path in os.environ.get('YATUBE_DB_REPLICAS', '').split(',')
+    if path
+]
+DATABASE_REPLICAS = []
+for number, path in enumerate(REPLICA_PATHS, 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['yatube.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_PIN_SECONDS = 10
+# Как часто `sync_replicas --interval` обновляет реплики. Фрагменты и
+# страницы, прочитанные с реплики, кэшируются не дольше этого срока.
+REPLICA_SYNC_INTERVAL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -157,3 +195,45 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам, а читаются при показе.
+FEED_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту при подписке.
+# Авторов, снова уложившихся в предел, доливает в ленты команда
+# `backfill_feeds`, которую запускают по расписанию.
+FEED_BACKFILL_SIZE = 1000
+
+# Сколько хранятся фрагменты лент. Фрагменты сбрасываются сменой версии
+# при записи постов, комментариев и групп, так что срок может быть большим,
+# но только с общим для процессов кэшем (Memcached, Redis): с LocMemCache
+# срок урезается до 20 секунд (posts/cache.py).
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Сколько секунд держится блокировка пересчёта фрагмента и насколько
+# рано (beta > 1 — раньше) фрагмент начинает обновляться до истечения.
+FEED_CACHE_LOCK_TIMEOUT = 30
+FEED_CACHE_EARLY_REFRESH_BETA = 1.0
+
+# За сколько секунд вклад комментария в «Популярное» уменьшается вдвое.
+TRENDING_HALF_LIFE = 60 * 60 * 6
+
+# Держать граф подписок в памяти процесса (posts/graph.py) и через
+# сколько секунд перечитывать его, чтобы увидеть подписки из других
+# процессов.
+FOLLOW_GRAPH_INDEX = False
+FOLLOW_GRAPH_MAX_AGE = 60
+
+# Сколько фоновых потоков создают миниатюры новых картинок постов;
+# 0 — создавать сразу после коммита, в том же потоке.
+THUMBNAIL_BACKGROUND_WORKERS = 2
+
+# Загрузки пишутся сразу во временные файлы, а не собираются в памяти.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Картинки постов: предел размера исходника в пикселях, наибольшая
+# сторона после уменьшения, формат и качество перекодирования.
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_MAX_SIDE = 2560
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 82
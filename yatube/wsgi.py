@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Граф подписок читается из базы до первого запроса, а не во время него.
+from posts import graph  # noqa: E402
+
+graph.warm()